@@ -0,0 +1,184 @@
+import re
+from collections import namedtuple
+from typing import List
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import boxutils
+from textutils import TextGen
+
+# bitmap is the tightly cropped ink, (dx, dy) its offset from the pen position and top of the line
+Glyph = namedtuple('Glyph', ['bitmap', 'dx', 'dy', 'advance'])
+
+# Lam (initial, medial) + final alef is a mandatory ligature, which the basic layout doesn't apply.
+# Exception parts like لا are kept as their frozen forms and drawn with the ligature, as raqm draws them.
+LAM_ALEF = {lam + alef: ligature
+            for lam, ligatures in (('\ufedf', '\ufef5\ufef7\ufef9\ufefb'), ('\ufee0', '\ufef6\ufef8\ufefa\ufefc'))
+            for alef, ligature in zip('\ufe82\ufe84\ufe88\ufe8e', ligatures)}
+_lam_alef_pattern = re.compile("|".join(LAM_ALEF))
+
+
+def ligate(part: str) -> str:
+    """The part with its lam-alef pairs replaced by their ligature forms, e.g. 'ﻠﺎ' -> 'ﻼ'."""
+    return _lam_alef_pattern.sub(lambda match: LAM_ALEF[match.group()], part)
+
+
+class GlyphAtlas:
+    """
+    Pre-rendered glyphs of presentation forms, used for composing words without shaping them.
+
+    Presentation forms are already shaped characters, so every form is drawn once with the basic
+    layout and cached along with its advance and bearings from the font. The only shaping left
+    is the lam-alef ligature of exception parts, see ligate.
+
+    Args:
+        font_path (str): absolute path for the .ttf font file.
+        font_size (int): font size for the text.
+        anti_alias (bool): keep gray edges, otherwise glyphs are thresholded to 0/255.
+    """
+
+    def __init__(self, font_path, font_size, anti_alias=False):
+        self.font = ImageFont.truetype(font_path, size=font_size, layout_engine=ImageFont.Layout.BASIC)
+        self.anti_alias = anti_alias
+        self.ascent, self.descent = self.font.getmetrics()
+        self._glyphs = {}
+
+    def glyph(self, part: str) -> Glyph:
+        """Glyph of a form, or of a multi form part (exceptions) drawn as one unit."""
+        glyph = self._glyphs.get(part)
+        if glyph is None:
+            glyph = self._glyphs[part] = self._render(part)
+        return glyph
+
+    def preload(self, parts):
+        for part in parts:
+            self.glyph(part)
+        return self
+
+    def __len__(self):
+        return len(self._glyphs)
+
+    def _render(self, part: str) -> Glyph:
+        visual = ligate(part)[::-1]  # basic layout draws left to right
+        advance = int(round(self.font.getlength(visual)))
+        l, t, r, b = self.font.getbbox(visual)
+        pad = 2
+        image = Image.new('L', (r - min(l, 0) + 2 * pad, b + 2 * pad), color='black')
+        ImageDraw.Draw(image).text((pad - min(l, 0), pad), visual, "white", font=self.font)
+        bitmap = np.array(image)
+        if not self.anti_alias:
+            bitmap = np.where(bitmap > 127, 255, 0).astype('uint8')
+        rows, cols = np.nonzero(bitmap.any(axis=1))[0], np.nonzero(bitmap.any(axis=0))[0]
+        if not len(rows):
+            return Glyph(np.zeros((0, 0), 'uint8'), 0, 0, advance)
+        y0, y1, x0, x1 = rows[0], rows[-1], cols[0], cols[-1]
+        return Glyph(bitmap[y0:y1 + 1, x0:x1 + 1], int(x0 - pad + min(l, 0)), int(y0 - pad), advance)
+
+    def compose(self, parts: List[str], margin=(4, 20)):
+        """
+        Blit the glyphs of a word into one canvas.
+
+        Args:
+            parts (list): forms of the word in logical (right to left) order.
+            margin (tuple): extra width and height, like TextGen.create_image pads the text.
+
+        Returns:
+            image (np.array): the (height, width) image.
+            boxes (np.array): (N, 4) inclusive ink boxes in left to right order, like TextGen.get_boxes.
+        """
+        glyphs = [self.glyph(part) for part in parts]
+        # Pen positions from the right edge of the word going left
+        advances = np.array([g.advance for g in glyphs], dtype=np.int64)
+        pens = advances.sum() - np.cumsum(advances)
+        xs = pens + np.array([g.dx for g in glyphs], dtype=np.int64)
+        ys = margin[1] // 2 + np.array([g.dy for g in glyphs], dtype=np.int64)
+        ws = np.array([g.bitmap.shape[1] for g in glyphs], dtype=np.int64)
+        hs = np.array([g.bitmap.shape[0] for g in glyphs], dtype=np.int64)
+        shift = max(0, -int(xs.min(initial=0)))
+        xs += shift
+        width = max(int(advances.sum()) + shift, int((xs + ws).max(initial=0))) + margin[0]
+        height = max(self.ascent + self.descent + margin[1], int((ys + hs).max(initial=0)))
+        image = np.zeros((height, width), 'uint8')
+        for g, x, y in zip(glyphs, xs, ys):
+            h, w = g.bitmap.shape
+            view = image[y:y + h, x:x + w]
+            np.maximum(view, g.bitmap, out=view)
+        boxes = np.stack([xs, ys, xs + ws - 1, ys + hs - 1], axis=1)
+        return image, boxes[::-1]
+
+
+class AtlasTextGen(TextGen):
+    """
+    TextGen that composes words from a glyph atlas, boxes come from the glyph placement
+    instead of being searched for in the image.
+    """
+
+    def __init__(self, font_path, font_size, exceptions=None, anti_alias=False, reject_unknown=True, binary=False):
+        # Glyphs are thresholded unless anti_alias is on, so atlas words are binary either way
+        super().__init__(font_path, font_size, exceptions, anti_alias, reject_unknown, binary)
+        self.atlas = GlyphAtlas(font_path, font_size, anti_alias)
+        self.atlas.preload(self.char_manager.get_persian_letter_forms())
+
+    def render_options(self) -> dict:
+        options = super().render_options()
+        options['engine'] = 'atlas'
+        return options
+
+    def render(self, text):
+        parts = self.get_characters(text, self.reject_unknown)
+        image, boxes = self.atlas.compose(parts)
+        return image, [tuple(box) for box in boxes.tolist()]
+
+
+def validate(atlas_gen: AtlasTextGen, pil_gen: TextGen, words, n=100, seed=None):
+    """
+    Compare the atlas renderer with the PIL one on a sample of words.
+
+    Returns:
+        summary (dict): mean box IoU, mean ink IoU of the aligned images, size differences
+            and the words which failed in either of the renderers.
+    """
+    rng = np.random.default_rng(seed)
+    words = [words[i] for i in rng.choice(len(words), min(n, len(words)), replace=False)]
+    box_ious, ink_ious, size_diffs, failed = [], [], [], []
+    for word in words:
+        try:
+            a_image, a_boxes = atlas_gen.render(word)
+            p_image, p_boxes = pil_gen.render(word)
+        except Exception as e:
+            failed.append((word, str(e)))
+            continue
+        if len(a_boxes) == len(p_boxes) and len(a_boxes):
+            box_ious.append(np.diag(boxutils.iou(a_boxes, p_boxes)).mean())
+        else:
+            failed.append((word, f"{len(a_boxes)} boxes against {len(p_boxes)}"))
+        h, w = min(a_image.shape[0], p_image.shape[0]), min(a_image.shape[1], p_image.shape[1])
+        a_ink, p_ink = a_image[:h, :w] > 127, p_image[:h, :w] > 127
+        union = (a_ink | p_ink).sum()
+        ink_ious.append((a_ink & p_ink).sum() / union if union else 1.)
+        size_diffs.append(np.subtract(a_image.shape, p_image.shape))
+    return {
+        'words': len(words),
+        'box_iou': float(np.mean(box_ious)) if box_ious else None,
+        'ink_iou': float(np.mean(ink_ious)) if ink_ious else None,
+        'mean_size_diff': np.mean(size_diffs, axis=0).tolist() if size_diffs else None,
+        'failed': failed,
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from params import font_path
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    exceptions = ['لا', 'لله', 'ریال']
+    atlas_gen = AtlasTextGen(font_path, 64, exceptions)
+    pil_gen = TextGen(font_path, 64, exceptions)
+    with open('words.csv', 'r', encoding='utf-8') as file:
+        alphabet = atlas_gen.char_manager.get_persian_letters()
+        words = [w for w in file.read().split('\n') if w and all(c in alphabet for c in w)]
+    start = time.time()
+    print(validate(atlas_gen, pil_gen, words, n))
+    print(f"validated in {time.time() - start:.2f}s")
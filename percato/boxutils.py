@@ -0,0 +1,104 @@
+"""
+Box post-processing on N×4 arrays.
+
+Boxes are inclusive pixel boxes (x0, y0, x1, y1) like TextGen.get_boxes makes them,
+x goes along the width of the image and y along its height.
+"""
+from typing import Tuple, Union
+
+import numpy as np
+
+XYXY = 'xyxy'
+XYWH = 'xywh'
+# Same values as detectron2.structures.BoxMode
+DETECTRON_MODES = {XYXY: 0, XYWH: 1}
+
+
+def as_boxes(boxes) -> np.ndarray:
+    """Boxes as an (N, 4) int array, an empty list gives a (0, 4) array."""
+    return np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+
+
+def loose(boxes, shape: Union[int, Tuple[int, int]], value: Union[int, float], axis=1) -> np.ndarray:
+    """
+    Loosen boxes along one axis and clip them to the image.
+
+    Args:
+        boxes: (N, 4) boxes.
+        shape: image shape as (height, width), or the size of the axis.
+        value (int or float): int is added to both sides, float divides the start and multiplies the end.
+        axis (int): 1 loosens y (height, default), 0 loosens x (width).
+    """
+    boxes = as_boxes(boxes)
+    size = shape if isinstance(shape, (int, np.integer)) else shape[0 if axis else 1]
+    start, end = boxes[:, axis].astype(float), boxes[:, axis + 2].astype(float)
+    if isinstance(value, (int, np.integer)):
+        start -= value
+        end += value
+    elif isinstance(value, float):
+        start /= value
+        end *= value
+    else:
+        raise TypeError(f'Unknown type {type(value)}')
+    lboxes = boxes.copy()
+    # Boxes are inclusive, the last pixel of the axis is size - 1
+    lboxes[:, axis] = np.clip(start, 0, size - 1)
+    lboxes[:, axis + 2] = np.clip(end, 0, size - 1)
+    return lboxes
+
+
+def clip(boxes, shape) -> np.ndarray:
+    """
+    Clip boxes into an image of the given (height, width).
+
+    shape can also be (N, 2), the shape of each box's image, to clip boxes of many images at once.
+    """
+    shape = np.asarray(shape)
+    h, w = (shape[:2] if shape.ndim == 1 else shape[:, :2]).T
+    boxes = as_boxes(boxes)
+    return np.clip(boxes, 0, np.stack([w - 1, h - 1, w - 1, h - 1], axis=-1))
+
+
+def convert(boxes, src=XYXY, dst=XYWH) -> np.ndarray:
+    """Convert boxes between XYXY (inclusive corners) and XYWH (corner and pixel size)."""
+    boxes = as_boxes(boxes)
+    if src == dst:
+        return boxes.copy()
+    out = boxes.copy()
+    if (src, dst) == (XYXY, XYWH):
+        out[:, 2:] = boxes[:, 2:] - boxes[:, :2] + 1
+    elif (src, dst) == (XYWH, XYXY):
+        out[:, 2:] = boxes[:, :2] + boxes[:, 2:] - 1
+    else:
+        raise ValueError(f'Unknown box modes {src} -> {dst}')
+    return out
+
+
+def area(boxes) -> np.ndarray:
+    boxes = as_boxes(boxes)
+    return (boxes[:, 2] - boxes[:, 0] + 1).clip(0) * (boxes[:, 3] - boxes[:, 1] + 1).clip(0)
+
+
+def iou(boxes_a, boxes_b) -> np.ndarray:
+    """(N, M) intersection over union of two sets of XYXY boxes."""
+    a, b = as_boxes(boxes_a), as_boxes(boxes_b)
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = (x1 - x0 + 1).clip(0) * (y1 - y0 + 1).clip(0)
+    union = area(a)[:, None] + area(b)[None, :] - inter
+    return np.divide(inter, union, out=np.zeros(inter.shape), where=union > 0)
+
+
+def in_bounds(boxes, shape) -> np.ndarray:
+    """
+    Whether each box is a valid box inside an image of the given (height, width).
+
+    shape can also be (N, 2), the shape of each box's image, to check boxes of many images at once.
+    """
+    shape = np.asarray(shape)
+    h, w = (shape[:2] if shape.ndim == 1 else shape[:, :2]).T
+    boxes = as_boxes(boxes)
+    return (boxes[:, 0] >= 0) & (boxes[:, 1] >= 0) & (boxes[:, 2] < w) & (boxes[:, 3] < h) & \
+        (boxes[:, 0] <= boxes[:, 2]) & (boxes[:, 1] <= boxes[:, 3])
@@ -1,8 +1,10 @@
 import json
 from enum import IntFlag
+from collections import Counter
 from typing import Union, Dict
 import random
 from copy import copy, deepcopy
+from functools import lru_cache
 
 
 class Character:
@@ -64,6 +66,13 @@ class PersianLetter(Character):
         return c
 
 
+@lru_cache(maxsize=None)
+def read_letters_json(json_path='letters.json') -> tuple:
+    """Parses letters.json once per path, callers must copy the dicts before changing them."""
+    with open(json_path, 'r', encoding="utf-8") as file:
+        return tuple(json.load(file)["letters"])
+
+
 class CharacterManager:
     sadiq_letters = ['ﺎ', 'ﺐ', 'ﺒ', 'ﺑ', 'ﺖ', 'ﺘ', 'ﺗ', 'ﺚ', 'ﺛ', 'ﺞ', 'ﺟ',
                      'ﺢ', 'ﺣ', 'ﺦ', 'ﺧ', 'ﺪ', 'ﺩ', 'ﺬ', 'ﺮ', 'ﺰ', 'ﺲ',
@@ -117,12 +126,10 @@ class CharacterManager:
 
     @staticmethod
     def load_persian_letters(json_path='letters.json'):
-        with open(json_path, 'r', encoding="utf-8") as file:
-            letters_dict_list = json.load(file)["letters"]
         letters = {}
-        for letter_dict in letters_dict_list:
+        for letter_dict in read_letters_json(json_path):
             letter = PersianLetter('\0')
-            letter.__dict__ = letter_dict
+            letter.__dict__ = dict(letter_dict)
             letters[letter.character] = letter
         return letters
 
@@ -163,6 +170,127 @@ class CharacterManager:
         return words
 
 
+class BalancedWordSampler:
+    """
+    Picks words so that the generated letter forms get closer to a target distribution.
+
+    Running per-form counts are kept from the frozen letters of every accepted word, and
+    each pick is the candidate whose forms are furthest behind their target share.
+
+    Args:
+        char_manager (CharacterManager): used for freezing letters into their forms.
+        words (list): dictionary words to choose from; random letter sequences are made if None.
+        target (dict): form -> weight, normalized internally (default: uniform over reachable forms).
+        length (tuple): min and max length of random letter sequences.
+        pool (int): number of candidates scored for each pick.
+        splitter (callable): word -> list of forms, e.g. TextGen.get_characters (default: freeze_letters).
+        seed: seed of the random generator.
+    """
+
+    def __init__(self, char_manager: CharacterManager, words=None, target: Dict[str, float] = None,
+                 length=(3, 6), pool=64, splitter=None, seed=None):
+        self.char_manager = char_manager
+        self.words = list(words) if words else None
+        self.length = length
+        self.pool = pool
+        self.splitter = splitter if splitter else lambda w: list(char_manager.freeze_letters(w))
+        self.random = random.Random(seed)
+        self.letters = char_manager.get_persian_letters()
+        self._parts_cache: Dict[str, list] = {}
+        self._form_words: Dict[str, list] = {}
+        if self.words:
+            for word in self.words:
+                for form in set(self.get_parts(word)):
+                    self._form_words.setdefault(form, []).append(word)
+        if target is None:
+            forms = self._form_words.keys() if self.words else char_manager.get_persian_letter_forms()
+            target = {form: 1 for form in forms}
+        weight_sum = sum(target.values())
+        self.target = {form: weight / weight_sum for form, weight in target.items()}
+        self.counts = Counter({form: 0 for form in self.target})
+        self.total = 0
+        self._use_words = bool(self.words)
+        self.rejected = set()
+
+    def get_parts(self, word: str) -> list:
+        parts = self._parts_cache.get(word)
+        if parts is None:
+            parts = self._parts_cache[word] = self.splitter(word)
+        return parts
+
+    def deficit(self, form: str) -> float:
+        """How many samples of the form are missing to match its target share."""
+        return self.target.get(form, 0) * self.total - self.counts[form]
+
+    def score(self, word: str) -> float:
+        """Mean deficit of the word's forms, forms out of target count as a surplus."""
+        parts = self.get_parts(word)
+        if not parts or word in self.rejected:
+            return float('-inf')
+        return sum(self.deficit(p) if p in self.target else -1 for p in parts) / len(parts)
+
+    def _letter_weights(self):
+        # Letters whose forms are lagging are more likely to be drawn for random candidates
+        weights = []
+        for c in self.letters:
+            letter = self.char_manager._letter_map[c]
+            forms = [f for f in (letter.isolated_form, letter.initial_form, letter.medial_form, letter.final_form)
+                     if f in self.target]
+            weights.append(1 + max((max(self.deficit(f), 0) for f in forms), default=0))
+        return weights
+
+    def lagging_form(self) -> str:
+        """The targeted form which is furthest behind its share."""
+        return min(self.target, key=lambda form: self.counts[form] / self.target[form])
+
+    def candidates(self) -> list:
+        if self._use_words:
+            # Rare forms are only in a handful of words, so draw from the words containing the lagging form
+            words = self._form_words.get(self.lagging_form()) or self.words
+            return self.random.sample(words, min(self.pool, len(words)))
+        weights = self._letter_weights()
+        return [''.join(self.random.choices(self.letters, weights, k=self.random.randint(*self.length)))
+                for _ in range(self.pool)]
+
+    def update(self, word: str) -> None:
+        """Count the forms of a word that has been generated."""
+        self.update_parts(self.get_parts(word))
+
+    def update_parts(self, parts) -> None:
+        """Count forms of the dataset, e.g. the parts of blocks generated by an earlier run."""
+        self.counts.update(p for p in parts if p in self.target)
+        self.total += len(parts)
+
+    def reject(self, word: str) -> None:
+        """Never pick the word again, e.g. because it is already in the dataset."""
+        self.rejected.add(word)
+        if self._use_words and word in self._parts_cache:
+            for form in set(self._parts_cache[word]):
+                self._form_words[form] = [w for w in self._form_words[form] if w != word]
+            self.words = [w for w in self.words if w != word]
+
+    def pick(self):
+        """The best candidate without counting it, None if every word is rejected."""
+        candidates = self.candidates()
+        if not candidates:
+            return None
+        word = max(candidates, key=self.score)
+        return word if self.score(word) > float('-inf') else None
+
+    def next_word(self) -> str:
+        word = self.pick()
+        if word is not None:
+            self.update(word)
+        return word
+
+    def sample(self, n: int) -> list:
+        return [self.next_word() for _ in range(n)]
+
+    def satisfied(self, min_count: int) -> bool:
+        """Whether every targeted form has at least min_count samples."""
+        return all(self.counts[form] >= min_count for form in self.target)
+
+
 if __name__ == '__main__':
     cm = CharacterManager()
     flm = cm.get_form_letter_map()
@@ -1,7 +1,90 @@
 import numpy as np
-from PIL import ImageColor, Image
+from PIL import Image
 
+import boxutils
+from labels import LabelRegistry
 from params import using_mask
+from visualize import draw_boxes
+
+
+class PackedImage:
+    """
+    A binary image cropped to its ink and bit-packed, about 8x smaller than the uint8 array.
+
+    Only ink or background is kept: gray pixels become full ink, so the packed image has the
+    same ink as the one get_boxes measured, but gray levels are lost. Render with
+    TextGen(binary=True) to pack images without losing anything.
+
+    Args:
+        bits (np.array): np.packbits of the cropped image.
+        crop_shape (tuple): (height, width) of the cropped image.
+        offset (tuple): (y, x) of the crop in the original image.
+        shape (tuple): (height, width) of the original image.
+    """
+
+    def __init__(self, bits: np.ndarray, crop_shape, offset, shape):
+        self.bits = bits
+        self.crop_shape = tuple(int(i) for i in crop_shape)
+        self.offset = tuple(int(i) for i in offset)
+        self.shape = tuple(int(i) for i in shape)
+
+    @staticmethod
+    def from_array(image: np.ndarray, threshold=0):
+        ink = image > threshold
+        rows, cols = np.nonzero(ink.any(axis=1))[0], np.nonzero(ink.any(axis=0))[0]
+        if len(rows):
+            y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        else:
+            y0 = y1 = x0 = x1 = 0
+        crop = ink[y0:y1, x0:x1]
+        return PackedImage(np.packbits(crop), crop.shape, (y0, x0), image.shape)
+
+    def crop(self) -> np.ndarray:
+        """The cropped image as 0/255 uint8."""
+        h, w = self.crop_shape
+        crop = np.unpackbits(self.bits, count=h * w).reshape(h, w)
+        return crop * np.uint8(255)
+
+    def to_array(self) -> np.ndarray:
+        """The image back in its original geometry."""
+        image = np.zeros(self.shape, 'uint8')
+        (y, x), (h, w) = self.offset, self.crop_shape
+        image[y:y + h, x:x + w] = self.crop()
+        return image
+
+    def crop_boxes(self, boxes) -> np.ndarray:
+        """Boxes of the original image moved into the cropped one."""
+        y, x = self.offset
+        return boxutils.as_boxes(boxes) - [x, y, x, y]
+
+    def uncrop_boxes(self, boxes) -> np.ndarray:
+        """Boxes of the cropped image moved back into the original one."""
+        y, x = self.offset
+        return boxutils.as_boxes(boxes) + [x, y, x, y]
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+
+def save_packed(path, packed: PackedImage, boxes):
+    """Save a packed image with its boxes (in cropped coordinates) as .npz."""
+    np.savez_compressed(path, bits=packed.bits, crop_shape=packed.crop_shape, offset=packed.offset,
+                        shape=packed.shape, boxes=packed.crop_boxes(boxes))
+
+
+def load_packed(path):
+    """
+    Load an image saved by save_packed, the pixels stay packed until to_array is called.
+
+    Returns:
+        packed (PackedImage): the packed image.
+        boxes (np.array): boxes in the original image geometry.
+    """
+    with np.load(path) as data:
+        packed = PackedImage(data['bits'], data['crop_shape'], data['offset'], data['shape'])
+        boxes = packed.uncrop_boxes(data['boxes'])
+    return packed, boxes
 
 
 class ImageMeta:
@@ -10,7 +93,7 @@ class ImageMeta:
 
     Args:
         text (str): input text for json.
-        image (np.array): the output image.
+        image (np.array): the output image, or a PackedImage.
         parts (list): text chars for json.
         boxes (): my anus hungers.
         id (int): wtf
@@ -30,6 +113,30 @@ class ImageMeta:
             self.id = ImageMeta.id
             ImageMeta.id += 1
 
+    @property
+    def image(self) -> np.ndarray:
+        if isinstance(self._image, PackedImage):
+            return self._image.to_array()
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+
+    @property
+    def shape(self):
+        return self._image.shape
+
+    def pack(self):
+        """Keep the image cropped and bit-packed in memory, image unpacks it on access."""
+        if not isinstance(self._image, PackedImage):
+            self._image = PackedImage.from_array(self._image)
+        return self
+
+    def save_packed(self, path):
+        save_packed(path, self.pack()._image, self.boxes)
+        return None
+
     def save_image(self, path, transpose=False):
         """
         Save image to the path.
@@ -42,37 +149,29 @@ class ImageMeta:
         image.save(path)
         return None
 
-    def save_image_with_boxes(self, path, color="yellow", transpose=True):
+    def save_image_with_boxes(self, path, color="yellow"):
         """
         Draw bbox on image and save to the path.
 
         Args:
             path (str): absolute path for the image.
             color (str): the color of bbox.
-            transpose (bool): transpose image array before saving (default: True).
         """
-        image = self.image.transpose()
-        image = np.concatenate([image[..., np.newaxis]] * 3, axis=2)
-        value = list(ImageColor.getrgb(color))
-        for x0, y0, x1, y1 in self.masks:
-            image[x0:x1 + 1, y0] = value
-            image[x0:x1 + 1, y1] = value
-            image[x0, y0:y1 + 1] = value
-            image[x1, y0:y1 + 1] = value
-        Image.fromarray(image.transpose((1, 0, 2))).save(path)
+        Image.fromarray(draw_boxes(self.image, self.boxes, color)).save(path)
         return None
 
-    def to_dict(self, path):
+    def to_dict(self, path, registry: LabelRegistry = None):
         """
         Generate a json block for the image. It's not in COCO format.
 
         Args:
             path (str): non-absolute path (name) of the image.
+            registry (LabelRegistry): when given, the class ids of the parts are saved as "classes".
 
         Returns:
             json_dic (dic): json block of the image.
         """
-        h, w = self.image.shape
+        h, w = self.shape
         # TODO: Use COCO standard format
         self.parts.reverse()
         if using_mask:
@@ -81,13 +180,15 @@ class ImageMeta:
         else:
             json_dic = {"id": self.id, "text": self.text, "image_name": path, "parts": self.parts,
                         "width": w, "height": h, "boxes": self.boxes, "n": self.length}
+        if registry is not None:
+            json_dic["classes"] = registry.ids(self.parts).tolist()
         return json_dic
 
 
 class DetectronMeta(ImageMeta):
 
-    def __init__(self, text, image: np.array, parts, boxes, image_dir, save_image=True, save_labeled_image=True, id=-1):
-        super().__init__(text, image, parts, boxes, id)
+    def __init__(self, text, image: np.array, parts, boxes, image_dir, save_image=True, save_labeled_image=False, id=-1):
+        super().__init__(text, image, parts, boxes, id=id)
         if save_image:
             self.file_name = f"{image_dir}/image{self.id}.png"
             self.save_image(self.file_name)
@@ -96,22 +197,16 @@ class DetectronMeta(ImageMeta):
             self.save_image_with_boxes(self.labeled_file_name)
 
     @staticmethod
-    def from_imagemeta(meta: ImageMeta, image_dir, save_image=True, save_labeled_image=True):
+    def from_imagemeta(meta: ImageMeta, image_dir, save_image=True, save_labeled_image=False):
         return DetectronMeta(
             meta.text, meta.image, meta.parts, meta.boxes, image_dir, save_image, save_labeled_image, meta.id)
 
-    _letters = []
-
-    def to_dict(self, letter_id_map=None):
-        if letter_id_map is None:
-            import warnings
-            warnings.warn("Consider not using auto ID.")
-            DetectronMeta._letters.extend(p for p in self.parts if p not in DetectronMeta._letters)
-            letter_id_map = {item: i for i, item in enumerate(DetectronMeta._letters)}
-        h, w = self.image.shape
+    def to_dict(self, registry: LabelRegistry):
+        """Detectron2 record of the image, class ids come from the dataset's registry (see labels.load_registry)."""
+        h, w = self.shape
         annotations = [
-            {'bbox': box, 'bbox_mode': 0, 'category_id': letter_id_map[part]} for box, part in
-            zip(self.boxes, self.parts)
+            {'bbox': box, 'bbox_mode': 0, 'category_id': int(i)} for box, i in
+            zip(self.boxes, registry.ids(self.parts))
         ]
         json_dict = {'file_name': self.file_name, 'height': h, 'width': w, 'image_id': self.id,
                      'annotations': annotations}
@@ -1,16 +1,33 @@
 import json
 import os
+
+import numpy as np
+
+import boxutils
+from labels import LabelRegistry, load_registry
 # import GenerDat.textutil
 
 
-def convert2detectron(img_dir):
-    json_file = os.path.join(img_dir, "final-pretty.json")
+def convert2detectron(img_dir, json_name="final-pretty.json", bbox_mode=boxutils.XYXY,
+                      registry: LabelRegistry = None):
+    json_file = os.path.join(img_dir, json_name)
+    # Class ids come from the dataset's labels.json, so they match the ones the generator saved
+    registry = registry if registry else load_registry(os.path.join(img_dir, "labels.json"))
     img_dir = os.path.join(img_dir, "images")
 
     with open(json_file) as f:
         imgs_anns = json.load(f)
 
+    # Boxes of the whole dataset are clipped and converted in one pass
+    counts = [block["n"] for block in imgs_anns]
+    all_boxes = boxutils.as_boxes([box for block in imgs_anns for box in block["boxes"][:block["n"]]])
+    shapes = np.repeat([[block["height"], block["width"]] for block in imgs_anns], counts, axis=0).reshape(-1, 2)
+    all_boxes = boxutils.clip(all_boxes, shapes)
+    all_boxes = boxutils.convert(all_boxes, boxutils.XYXY, bbox_mode).tolist()
+    mode = boxutils.DETECTRON_MODES[bbox_mode]
+
     dataset_dicts = []
+    start = 0
     for idx in range(len(imgs_anns)):
         block = imgs_anns[idx]
         record = {}
@@ -22,21 +39,21 @@ def convert2detectron(img_dir):
         record["height"] = block["height"]
         record["width"] = block["width"]
 
+        if "classes" in block:
+            classes = block["classes"]
+        else:
+            classes = registry.ids(block["parts"][:block["n"]]).tolist()
         annos = []
         for id_harf in range(block["n"]):
-            harf = block["parts"][id_harf]
             # mask = block["encoded_masks"][id_harf].split()
-            bbox = block["box"][id_harf]
             obj = {
-                # "bbox": [np.min(px), np.min(py), np.max(px), np.max(py)],
-                # "bbox_mode": BoxMode.XYXY_ABS,
                 # "segmentation": [list(mask)],
-                # "category_id": 0
-                "category_id": harf,
-                "bbox": bbox,
-                "bbox_mode": 0
+                "category_id": classes[id_harf],
+                "bbox": all_boxes[start + id_harf],
+                "bbox_mode": mode
             }
             annos.append(obj)
+        start += block["n"]
         record["annotations"] = annos
         dataset_dicts.append(record)
     return dataset_dicts
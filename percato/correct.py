@@ -0,0 +1,212 @@
+import json
+import os
+import tempfile
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Sequence
+
+from characterutil import CharacterManager
+
+# Arabic letters which NFKC gives for some presentation forms, Persian words use the other ones
+ARABIC_TO_PERSIAN = {'ك': 'ک', 'ي': 'ی', 'ى': 'ی', 'ة': 'ه'}
+
+
+def get_form_map(char_manager: CharacterManager = None) -> Dict[str, str]:
+    """Presentation form -> base letter, the inverse of CharacterManager.freeze_letters."""
+    char_manager = char_manager if char_manager else CharacterManager()
+    form_map = {}
+    for letter in char_manager.get_persian_letters(as_dict=True).values():
+        for form in (letter.initial_form, letter.medial_form, letter.final_form, letter.isolated_form):
+            if form:
+                form_map[form] = letter.character
+    return form_map
+
+
+def to_letters(forms: Sequence[str], form_map: Dict[str, str]) -> List[str]:
+    """
+    Base letters of a list of forms, e.g. ['ﺳ', 'ﻠﺎ', 'ﻡ'] -> ['س', 'ل', 'ا', 'م'].
+
+    Multi form parts (exceptions) are mapped letter by letter.
+    """
+    letters = []
+    for part in forms:
+        for c in part:
+            letter = form_map.get(c)
+            if letter is None:
+                letter = unicodedata.normalize('NFKC', c)
+                letter = ARABIC_TO_PERSIAN.get(letter, letter)
+            letters.append(letter)
+    return letters
+
+
+def deletes(word: str, n=1) -> set:
+    """The word with up to n of its letters deleted, in every possible way."""
+    variants, frontier = {word}, {word}
+    for _ in range(n):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+def weighted_distance(letters: Sequence[str], scores: Sequence[float], word: str) -> float:
+    """
+    Edit distance where changing or dropping a detected letter costs its detection score,
+    so unsure letters are cheap to fix. Adding a missed letter costs 1.
+    """
+    previous = [float(j) for j in range(len(word) + 1)]
+    for c, s in zip(letters, scores):
+        current = [previous[0] + s]
+        for j, w in enumerate(word, 1):
+            current.append(min(previous[j] + s, current[j - 1] + 1, previous[j - 1] + (s if c != w else 0)))
+        previous = current
+    return previous[-1]
+
+
+class Lexicon:
+    """
+    Valid words indexed by their deletion variants, for finding the closest word to a decoded prediction.
+
+    Two words sharing a variant with one deletion each are at most 2 edits apart, so a lookup is
+    a handful of dict hits instead of a walk over a tree, and every word within one edit is found.
+    When nothing is that close, the detected word is searched with one more deletion, which finds
+    words two edits away if one of them is an extra detected letter, but not e.g. two changed letters.
+    Candidates are then ranked by the score weighted distance.
+
+    Args:
+        words (list): the valid words.
+        depth (int): deletions indexed per word, 1 finds all words within one edit and some within two.
+    """
+
+    def __init__(self, words, depth=1):
+        self.depth = depth
+        self.words = []
+        self.index: Dict[str, List[int]] = {}
+        self._exact = set()
+        self._init_cache()
+        for word in words:
+            self.add(word)
+
+    def _init_cache(self):
+        # Per instance, a cache on the class would keep every lexicon alive
+        self._correct_cached = lru_cache(maxsize=65536)(self._correct)
+
+    def add(self, word: str):
+        if not word or word in self._exact:
+            return None
+        self._exact.add(word)
+        self.words.append(word)
+        for variant in deletes(word, self.depth):
+            self.index.setdefault(variant, []).append(len(self.words) - 1)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self._exact
+
+    def search(self, word: str, depth=None) -> List[str]:
+        """Words sharing a deletion variant with word, depth deletions of word are tried (default: the index depth)."""
+        found = set()
+        for variant in deletes(word, depth if depth else self.depth):
+            found.update(self.index.get(variant, ()))
+        return [self.words[i] for i in sorted(found)]
+
+    def correct(self, letters: Sequence[str], scores: Sequence[float] = None):
+        """
+        The closest valid word to the detected letters.
+
+        Returns:
+            word (str): the corrected word, the detected one if nothing is close enough.
+            cost (float): the weighted edit cost of the correction.
+        """
+        text = "".join(letters)
+        if text in self._exact:
+            return text, 0.
+        scores = tuple(scores) if scores is not None else (1.,) * len(letters)
+        return self._correct_cached(tuple(letters), scores)
+
+    def _correct(self, letters, scores):
+        text = "".join(letters)
+        candidates = self.search(text) or self.search(text, self.depth + 1)
+        if not candidates:
+            return text, float('inf')
+        costs = [weighted_distance(letters, scores, word) for word in candidates]
+        best = min(range(len(candidates)), key=lambda i: (costs[i], candidates[i]))
+        return candidates[best], costs[best]
+
+    @staticmethod
+    def load(words_path='words.csv', cache_path=None, depth=1):
+        """
+        Lexicon of a word list, built once and cached next to it as json.
+
+        The cache is rebuilt when the word list changes (size or modification time) or can't be
+        read. When it can't be written, the lexicon is built in memory on every load.
+        """
+        cache_path = cache_path if cache_path else os.path.splitext(words_path)[0] + '.lexicon.json'
+        stat = os.stat(words_path)
+        key = [os.path.basename(words_path), stat.st_size, stat.st_mtime_ns, depth]
+        lexicon = Lexicon._read_cache(cache_path, key)
+        if lexicon is not None:
+            return lexicon
+        with open(words_path, 'r', encoding='utf-8') as file:
+            lexicon = Lexicon((word.strip() for word in file.read().split('\n')), depth)
+        try:
+            lexicon._write_cache(cache_path, key)
+        except OSError as e:
+            # e.g. the package's words.csv on a read-only install, the index is only kept in memory
+            print(f"Could not cache the lexicon in {cache_path}: {e}")
+        return lexicon
+
+    @staticmethod
+    def _read_cache(path, key):
+        """The cached lexicon, None if there's none for this key or it's broken."""
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data['key'] != key:
+                return None
+            lexicon = Lexicon((), data['depth'])
+            lexicon.__setstate__({'depth': data['depth'], 'words': data['words'], 'index': data['index']})
+            return lexicon
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_cache(self, path, key):
+        # Written to a temporary file and renamed, so an interrupted write never leaves a broken cache
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.lexicon-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump({'key': key, **self.__getstate__()}, file, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def __getstate__(self):
+        return {'depth': self.depth, 'words': self.words, 'index': self.index}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._exact = set(self.words)
+        self._init_cache()
+
+
+class Corrector:
+    """
+    Post-correction of decoded predictions: forms back to letters, then the closest valid word.
+
+    Args:
+        lexicon (Lexicon): valid words.
+    """
+
+    def __init__(self, lexicon: Lexicon, char_manager=None):
+        self.lexicon = lexicon
+        self.form_map = get_form_map(char_manager)
+
+    def correct_forms(self, forms: Sequence[str], scores: Sequence[float] = None):
+        letters = to_letters(forms, self.form_map)
+        if scores is not None:
+            # A multi letter part spreads its score over its letters
+            scores = [s for part, s in zip(forms, scores) for _ in part]
+        return self.lexicon.correct(letters, scores)
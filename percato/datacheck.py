@@ -2,7 +2,9 @@ import json
 import pprint
 import re
 
-from main import json_path
+from params import json_path
+
+pp = pprint.PrettyPrinter(indent=2)
 
 
 def sum_class(json_path):
@@ -64,7 +66,6 @@ def map_check(alph, checkdic):
 
 
 if __name__ == "__main__":
-    pp = pprint.PrettyPrinter(indent=2)
     # json_path = '/home/sadegh/Projects/OCR/datasets/data10/final.json'
     # new_alph = textutil.TextGen.get_join_alphabet(view=False)
     # org_alph = textutil.ALPHABET
@@ -0,0 +1,67 @@
+import hashlib
+import json
+from pathlib import Path
+
+
+class DedupIndex:
+    """
+    Keeps track of rendered samples so the same word is not rendered and stored twice.
+
+    Samples are keyed by a hash of the word, font, size and render options. The index is an
+    append-only json-lines file saved next to the dataset, so extend/resume runs load it and
+    keep skipping the samples that already exist.
+
+    Args:
+        path (str): path of the index file, created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._entries = {}
+        self.next_id = 0
+        if self.path.is_file():
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry['key']] = entry['block']
+                        self.next_id = max(self.next_id, entry['block']['id'] + 1)
+        self._file = None
+
+    @staticmethod
+    def make_key(text, options: dict) -> str:
+        """Hash of a word and everything that changes its pixels."""
+        payload = json.dumps([text, options], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """json block of the already rendered sample, or None."""
+        return self._entries.get(key)
+
+    def add(self, key, block: dict):
+        self._entries[key] = block
+        self.next_id = max(self.next_id, block['id'] + 1)
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps({'key': key, 'block': block}, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,152 @@
+"""
+Evaluates model predictions (COCO results json) against the generated ground truth json.
+
+Predictions are parsed into flat arrays held in memory (a few numbers per detection), then the
+ground truth is streamed image by image and matched against its slice of the predictions with
+an IoU matrix.
+"""
+import json
+
+import numpy as np
+
+import boxutils
+from correct import weighted_distance
+from jsonstream import iter_json_array
+from labels import LabelRegistry, model_registry
+from predict import results_to_arrays, take
+
+
+def load_predictions(path):
+    """Flat arrays of a COCO results file sorted by image_id, see predict.results_to_arrays."""
+    arrays = results_to_arrays(iter_json_array(path))
+    return take(arrays, np.argsort(arrays['image_ids'], kind='stable'))
+
+
+def match(gt_boxes, pred_boxes, pred_scores, iou_threshold=0.5):
+    """
+    Greedy matching of predictions to ground truth boxes, best scores first.
+
+    Returns:
+        (N_pred,) index of the matched ground truth box of each prediction, -1 if none.
+    """
+    matches = np.full(len(pred_boxes), -1)
+    if not len(gt_boxes) or not len(pred_boxes):
+        return matches
+    ious = boxutils.iou(pred_boxes, gt_boxes)
+    ious[ious < iou_threshold] = 0
+    for p in np.argsort(-pred_scores, kind='stable'):
+        g = np.argmax(ious[p])
+        if ious[p, g] > 0:
+            matches[p] = g
+            ious[:, g] = 0
+    return matches
+
+
+def reading_order(boxes):
+    """Right to left order of the characters of a word."""
+    return np.argsort(-boxutils.as_boxes(boxes)[:, 0], kind='stable')
+
+
+class Evaluation:
+    """
+    Accumulates matching results of a whole validation set.
+
+    Args:
+        n_classes (int): number of model classes, the last row/column of the confusion
+            matrix is background (missed or false detections).
+        iou_threshold (float): minimum IoU of a match.
+        score_threshold (float): predictions under this score are ignored.
+    """
+
+    def __init__(self, n_classes, iou_threshold=0.5, score_threshold=0.7):
+        self.n_classes = n_classes
+        self.iou_threshold = iou_threshold
+        self.score_threshold = score_threshold
+        self.confusion = np.zeros((n_classes + 1, n_classes + 1), np.int64)
+        self.char_errors = 0
+        self.chars = 0
+        self.words_correct = 0
+        self.words = 0
+
+    def add(self, gt_classes, gt_boxes, pred_classes, pred_boxes, pred_scores):
+        keep = pred_scores >= self.score_threshold
+        pred_classes, pred_boxes, pred_scores = pred_classes[keep], pred_boxes[keep], pred_scores[keep]
+        background = self.n_classes
+        pred_classes = np.where((pred_classes >= 0) & (pred_classes < background), pred_classes, background)
+        gt_classes = np.where((gt_classes >= 0) & (gt_classes < background), gt_classes, background)
+        matches = match(gt_boxes, pred_boxes, pred_scores, self.iou_threshold)
+        matched = matches >= 0
+        # Rows are ground truth, columns are predictions
+        np.add.at(self.confusion, (gt_classes[matches[matched]], pred_classes[matched]), 1)
+        np.add.at(self.confusion, (np.full((~matched).sum(), background), pred_classes[~matched]), 1)
+        missed = np.ones(len(gt_classes), '?')
+        missed[matches[matched]] = False
+        np.add.at(self.confusion, (gt_classes[missed], np.full(missed.sum(), background)), 1)
+
+        truth = tuple(gt_classes[reading_order(gt_boxes)])
+        predicted = tuple(pred_classes[reading_order(pred_boxes)])
+        self.char_errors += int(weighted_distance(predicted, [1] * len(predicted), truth))
+        self.chars += len(truth)
+        self.words_correct += truth == predicted
+        self.words += 1
+
+    def report(self, class_names=None) -> dict:
+        tp = np.diag(self.confusion)[:-1]
+        predicted = self.confusion[:, :-1].sum(axis=0)
+        actual = self.confusion[:-1].sum(axis=1)
+        precision = np.divide(tp, predicted, out=np.zeros(len(tp)), where=predicted > 0)
+        recall = np.divide(tp, actual, out=np.zeros(len(tp)), where=actual > 0)
+        names = class_names if class_names else [str(i) for i in range(self.n_classes)]
+        return {
+            'images': self.words,
+            'cer': self.char_errors / self.chars if self.chars else 0.,
+            'word_accuracy': self.words_correct / self.words if self.words else 0.,
+            'precision': float(tp.sum() / predicted.sum()) if predicted.sum() else 0.,
+            'recall': float(tp.sum() / actual.sum()) if actual.sum() else 0.,
+            'per_class': {names[i]: {'precision': float(precision[i]), 'recall': float(recall[i]),
+                                     'support': int(actual[i])} for i in range(self.n_classes)},
+            'confusion': self.confusion.tolist(),
+            'confusion_labels': list(names) + ['background'],
+        }
+
+
+def evaluate(gt_path, pred_path, registry: LabelRegistry = None, iou_threshold=0.5, score_threshold=0.7,
+             by_id=False):
+    """
+    Evaluate a results file against the generated json.
+
+    Args:
+        gt_path (str): the generated json (parts and boxes of every image).
+        pred_path (str): coco_instances_results.json of the model.
+        registry (LabelRegistry): classes of the model (default: labels.model_registry()).
+        by_id (bool): match images by the 'id' of the blocks instead of their position,
+            convert2detectron numbers images by position.
+    """
+    registry = registry if registry else model_registry()
+    n_classes, names = len(registry), list(registry.labels)
+    preds = load_predictions(pred_path)
+    evaluation = Evaluation(n_classes, iou_threshold, score_threshold)
+    for idx, block in enumerate(iter_json_array(gt_path)):
+        image_id = block['id'] if by_id else idx
+        start, end = np.searchsorted(preds['image_ids'], [image_id, image_id + 1])
+        if 'classes' in block:
+            # Dataset registries extend the model's, ids past the model classes count as background
+            gt_classes = np.array(block['classes'][:block['n']], dtype=np.int64)
+        else:
+            gt_classes = registry.ids(block['parts'][:block['n']], default=-1)
+        evaluation.add(gt_classes, boxutils.as_boxes(block['boxes'][:block['n']]),
+                       preds['classes'][start:end], preds['boxes'][start:end], preds['scores'][start:end])
+    return evaluation.report(names)
+
+
+def print_report(report):
+    print(f"images: {report['images']}  CER: {report['cer']:.4f}  word accuracy: {report['word_accuracy']:.4f}  "
+          f"precision: {report['precision']:.4f}  recall: {report['recall']:.4f}")
+    for name, c in report['per_class'].items():
+        if c['support']:
+            print(f"{name}\tP {c['precision']:.3f}\tR {c['recall']:.3f}\tn {c['support']}")
+
+
+def write_report(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,265 @@
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import cv2
+import numpy as np
+
+import predict
+from segment import segment_words, crop_words
+
+PDF_SUFFIXES = {'.pdf'}
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp'}
+_DONE = object()
+
+
+def load_pages(path, dpi=200):
+    """Yields gray pages of an image or a pdf file, PyMuPDF is needed for pdfs."""
+    path = Path(path)
+    if path.suffix.lower() in PDF_SUFFIXES:
+        try:
+            import fitz
+        except ImportError:
+            raise ImportError("PyMuPDF is needed for reading pdf files: pip install pymupdf")
+        with fitz.open(str(path)) as doc:
+            for page in doc:
+                pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+                yield np.frombuffer(pix.samples, 'uint8').reshape(pix.height, pix.width).copy()
+    else:
+        page = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if page is None:
+            raise FileNotFoundError('Could not read image', str(path))
+        yield page
+
+
+def binarize(page: np.ndarray) -> np.ndarray:
+    """White text on black like the generated images, scans are dark text on light paper."""
+    _, binary = cv2.threshold(page, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return binary
+
+
+class Detector:
+    """Interface of the character detectors used by OCRPipeline."""
+
+    def predict(self, images: List[np.ndarray]) -> List[dict]:
+        """
+        Detect characters of a batch of word images.
+
+        Returns:
+            One dict per image with 'boxes' (N, 4) XYXY, 'scores' (N,) and 'classes' (N,) arrays.
+        """
+        raise NotImplementedError
+
+
+class StubDetector(Detector):
+    """
+    CPU stand-in for the model, every connected component of a word is a character.
+
+    Classes are made from the component size, it's only meant for testing and benchmarking
+    the pipeline without Detectron2 or a GPU.
+    """
+
+    def __init__(self, n_classes=66, delay=0.):
+        self.n_classes = n_classes
+        self.delay = delay
+
+    def predict(self, images):
+        outputs = []
+        for image in images:
+            n, _, stats, _ = cv2.connectedComponentsWithStats((image > 127).astype('uint8'), connectivity=8)
+            x, y, w, h, a = stats[1:].T
+            outputs.append({'boxes': np.stack([x, y, x + w - 1, y + h - 1], axis=1),
+                            'scores': np.ones(n - 1),
+                            'classes': a % self.n_classes})
+        if self.delay:
+            time.sleep(self.delay)
+        return outputs
+
+
+class Detectron2Detector(Detector):
+    """
+    Detector on top of a trained Detectron2 model.
+
+    Args:
+        config_path (str): yaml config of the model.
+        weights_path (str): trained weights, e.g. model_final.pth.
+        threshold (float): minimum score of the model's test time output.
+        device (str): 'cuda' or 'cpu'.
+    """
+
+    def __init__(self, config_path, weights_path, threshold=0.5, device='cuda'):
+        if not config_path or not weights_path:
+            raise ValueError("The config and the weights of the model are needed for Detectron2Detector")
+        try:
+            from detectron2.config import get_cfg
+            from detectron2.engine import DefaultPredictor
+        except ImportError:
+            raise ImportError("Detectron2 is needed for this detector, see the README requirements")
+        cfg = get_cfg()
+        cfg.merge_from_file(config_path)
+        cfg.MODEL.WEIGHTS = weights_path
+        cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = threshold
+        cfg.MODEL.DEVICE = device
+        # The predictor is kept for its test time resize, the model was trained on resized inputs
+        self.predictor = DefaultPredictor(cfg)
+        self.model = self.predictor.model
+        self.input_format = cfg.INPUT.FORMAT
+
+    def predict(self, images):
+        import torch
+        inputs = []
+        for image in images:
+            rgb = np.repeat(image[..., np.newaxis], 3, axis=2)
+            if self.input_format == 'BGR':
+                rgb = rgb[..., ::-1]
+            h, w = image.shape
+            # Like DefaultPredictor.__call__: resize for the model, outputs are scaled back to height/width
+            resized = self.predictor.aug.get_transform(rgb).apply_image(np.ascontiguousarray(rgb))
+            inputs.append({'image': torch.as_tensor(resized.astype('float32').transpose(2, 0, 1)),
+                           'height': h, 'width': w})
+        with torch.no_grad():
+            results = self.model(inputs)
+        outputs = []
+        for result in results:
+            instances = result['instances'].to('cpu')
+            outputs.append({'boxes': instances.pred_boxes.tensor.numpy().round().astype(np.int64),
+                            'scores': instances.scores.numpy(),
+                            'classes': instances.pred_classes.numpy()})
+        return outputs
+
+
+def decode(outputs: List[dict], postprocess=None) -> list:
+    """
+    (forms, scores) of every word from the detector outputs of a batch of words.
+
+    Detections go through the same score filtering, NMS and ordering as predict.py.
+
+    Args:
+        postprocess (callable): arrays -> arrays (default: predict.postprocess with its defaults).
+    """
+    postprocess = postprocess if postprocess else predict.postprocess
+    words = {image_id: (forms, scores)
+             for image_id, forms, scores in predict.split_words(postprocess(predict.outputs_to_arrays(outputs)))}
+    return [words.get(i, ([], [])) for i in range(len(outputs))]
+
+
+class OCRPipeline:
+    """
+    Pages to words, with pre and post-processing overlapping the model.
+
+    A reader thread loads and segments pages into word crops, the calling thread runs the
+    detector on micro-batches of crops, and a writer thread decodes the outputs.
+
+    Args:
+        detector (Detector): the character detector.
+        batch_size (int): crops per detector call.
+        queue_size (int): maximum crops waiting for the detector.
+        corrector (Corrector): corrects decoded words to valid words, see correct.py.
+        postprocess (callable): score filtering and NMS of the detections, see decode.
+    """
+
+    def __init__(self, detector: Detector, batch_size=16, queue_size=256, dpi=200, corrector=None,
+                 postprocess=None):
+        self.detector = detector
+        self.corrector = corrector
+        self.postprocess = postprocess
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.dpi = dpi
+        self.stats = {}
+
+    def _read(self, paths, crops: queue.Queue, errors: list, stop: threading.Event):
+        try:
+            page_id = 0
+            for path in paths:
+                for page in load_pages(path, self.dpi):
+                    if stop.is_set():
+                        return
+                    binary = binarize(page)
+                    segmentation = segment_words(binary)
+                    for box, line, crop in zip(segmentation.boxes, segmentation.lines,
+                                               crop_words(binary, segmentation.boxes)):
+                        crops.put((page_id, str(path), box, line, crop))
+                    page_id += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            crops.put(_DONE)
+
+    def _write(self, outputs: queue.Queue, results: list, errors: list):
+        while True:
+            item = outputs.get()
+            if item is _DONE:
+                return
+            try:
+                batch, predictions = item
+                for (page_id, path, box, line, _), (forms, scores) in zip(batch, decode(predictions,
+                                                                                        self.postprocess)):
+                    result = {'page': page_id, 'file': path, 'line': int(line),
+                              'box': [int(i) for i in box], 'text': forms}
+                    if self.corrector is not None:
+                        result['word'], result['cost'] = self.corrector.correct_forms(forms, scores)
+                    results.append(result)
+            except Exception as e:
+                errors.append(e)
+
+    def run(self, paths) -> list:
+        """
+        OCR the given images and pdfs.
+
+        Returns:
+            One dict per word with its page number, file, line, box in the page and decoded characters,
+            in page then reading order.
+        """
+        crops, outputs = queue.Queue(self.queue_size), queue.Queue()
+        results, errors = [], []
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read, args=(paths, crops, errors, stop), daemon=True)
+        writer = threading.Thread(target=self._write, args=(outputs, results, errors), daemon=True)
+        reader.start()
+        writer.start()
+        start, model_time, n_crops = time.time(), 0., 0
+        done = False
+        try:
+            while not done:
+                batch = []
+                while len(batch) < self.batch_size:
+                    item = crops.get() if not batch else self._get_nowait(crops)
+                    if item is None:
+                        break
+                    if item is _DONE:
+                        done = True
+                        break
+                    batch.append(item)
+                if batch:
+                    t = time.time()
+                    predictions = self.detector.predict([item[-1] for item in batch])
+                    model_time += time.time() - t
+                    n_crops += len(batch)
+                    outputs.put((batch, predictions))
+        finally:
+            outputs.put(_DONE)
+            if not done:
+                # The detector failed: stop the reader after its page and unblock it if the queue is full
+                stop.set()
+                while crops.get() is not _DONE:
+                    pass
+            reader.join()
+            writer.join()
+        if errors:
+            raise errors[0]
+        total = time.time() - start
+        self.stats = {'crops': n_crops, 'seconds': total, 'model_seconds': model_time,
+                      'crops_per_second': n_crops / total if total else 0.}
+        results.sort(key=lambda r: (r['page'], r['line'], -r['box'][2]))
+        return results
+
+    @staticmethod
+    def _get_nowait(q: queue.Queue):
+        # Don't hold a partial batch back waiting for the reader
+        try:
+            return q.get_nowait()
+        except queue.Empty:
+            return None
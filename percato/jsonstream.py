@@ -0,0 +1,51 @@
+import json
+import re
+from typing import Iterator
+
+_decoder = json.JSONDecoder()
+_separator = re.compile(r'[\s,]*')
+
+
+def iter_json_array(path, chunk_size=1 << 20) -> Iterator[dict]:
+    """
+    Yields the objects of a top level json array one by one, without loading the whole file.
+
+    Only arrays of objects are streamed: an object is complete once its closing brace is read,
+    while a number cut at the end of a chunk would still decode.
+
+    Args:
+        path (str): path of a json file containing one array of objects, like the generated json.
+        chunk_size (int): characters read at a time.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer, eof = '', False
+        while not buffer and not eof:
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = chunk.lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} is not a json array")
+        pos = 1
+        while True:
+            pos = _separator.match(buffer, pos).end()
+            if pos < len(buffer):
+                if buffer[pos] == ']':
+                    return
+                if buffer[pos] != '{':
+                    raise ValueError(f"{path} is not an array of objects, found {buffer[pos]!r}")
+                try:
+                    item, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    pos = end
+                    yield item
+                    continue
+            elif eof:
+                raise ValueError(f"{path} ends before its array is closed")
+            # The item (or the separator) goes on in the next chunk
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, Sequence
+
+import numpy as np
+
+# Classes of the trained model, in their id order
+MODEL_LABELS = ('ﺎ', 'ﺐ', 'ﺑ', 'ﺖ', 'ﺗ', 'ﺚ',
+                'ﺛ', 'ﺞ', 'ﺟ', 'ﺢ', 'ﺣ', 'ﺦ',
+                'ﺧ', 'ﺪ', 'ﺬ', 'ﺮ', 'ﺰ', 'ﺲ',
+                'ﺳ', 'ﺶ', 'ﺷ', 'ﺺ', 'ﺻ', 'ﺾ',
+                'ﺿ', 'ﻂ', 'ﻆ', 'ﻉ', 'ﻊ', 'ﻋ',
+                'ﻌ', 'ﻍ', 'ﻎ', 'ﻏ', 'ﻐ', 'ﻒ',
+                'ﻓ', 'ﻖ', 'ﻗ', 'ﻘ', 'ﻚ', 'ﻛ',
+                'ﻞ', 'ﻟ', 'ﻠ', 'ﻢ', 'ﻣ', 'ﻦ',
+                'ﻧ', 'ﻩ', 'ﻪ', 'ﻫ', 'ﻬ', 'ﻮ',
+                'ﯼ', 'ﯾ', 'ﭗ', 'ﭘ', 'ﭻ', 'ﭼ',
+                'ﮋ', 'ﮓ', 'ﮔ', 'ﺋ', 'ﺁ', 'لا')
+
+
+class LabelRegistry:
+    """
+    Two way form <-> class id map shared by the generator, the converter and the decoder.
+
+    Ids are positions in the label list, so a registry that only grows keeps old ids valid.
+    The version is a hash of the labels and is saved with the dataset.
+
+    Args:
+        labels (list): forms in id order.
+        frozen (bool): unknown forms raise a KeyError instead of getting a new id.
+    """
+
+    def __init__(self, labels: Sequence[str], frozen=True):
+        self._labels = []
+        self._ids: Dict[str, int] = {}
+        self.frozen = False
+        for label in labels:
+            self.add(label)
+        self.frozen = frozen
+
+    def add(self, form: str) -> int:
+        """Id of the form, new forms are appended unless the registry is frozen."""
+        i = self._ids.get(form)
+        if i is None:
+            if self.frozen:
+                raise KeyError(f"Unknown label '{form}'")
+            i = self._ids[form] = len(self._labels)
+            self._labels.append(form)
+        return i
+
+    def id(self, form: str, default=None) -> int:
+        i = self._ids.get(form, default)
+        if i is None:
+            return self.add(form)
+        return i
+
+    def form(self, i: int) -> str:
+        return self._labels[i]
+
+    def ids(self, forms: Iterable[str], default=None) -> np.ndarray:
+        return np.array([self.id(form, default) for form in forms], dtype=np.int64)
+
+    def forms(self, ids, unknown='?') -> list:
+        labels = self.label_array(unknown)
+        ids = np.asarray(ids, dtype=np.int64)
+        return labels[np.where((ids >= 0) & (ids < len(self._labels)), ids, len(self._labels))].tolist()
+
+    def label_array(self, unknown='?') -> np.ndarray:
+        """Object array of the labels with unknown at the end, for indexing with id arrays."""
+        return np.array(self._labels + [unknown], dtype=object)
+
+    @property
+    def labels(self) -> tuple:
+        return tuple(self._labels)
+
+    def label_map(self) -> Dict[str, int]:
+        return dict(self._ids)
+
+    @property
+    def version(self) -> str:
+        return hashlib.sha1("\n".join(self._labels).encode('utf-8')).hexdigest()[:12]
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __contains__(self, form):
+        return form in self._ids
+
+    def copy(self, frozen=None):
+        return LabelRegistry(self._labels, self.frozen if frozen is None else frozen)
+
+    def sync(self, forms: Iterable[str], ids: Iterable[int]):
+        """
+        Take in the ids a block was saved with, e.g. when labels.json of an interrupted run is behind its json.
+
+        Raises ValueError when an id already belongs to another form or can't be given to its form.
+        """
+        for i, form in sorted(zip(ids, forms)):
+            if i < len(self._labels):
+                if self._labels[i] != form:
+                    raise ValueError(f"Label {i} is '{self._labels[i]}' but a block has it as '{form}'")
+            elif i == len(self._labels) and form not in self._ids and not self.frozen:
+                self.add(form)
+            else:
+                raise ValueError(f"Label {i} of '{form}' doesn't follow the {len(self._labels)} known labels")
+
+    def save(self, path):
+        # Written next to the target and renamed, so an interrupted save leaves the old labels
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': self.version, 'labels': self._labels}, file, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path, frozen=True):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        registry = LabelRegistry(data['labels'], frozen)
+        if data.get('version', registry.version) != registry.version:
+            raise ValueError(f"Labels of {path} don't match their version {data['version']}")
+        return registry
+
+
+@lru_cache(maxsize=None)
+def model_registry() -> LabelRegistry:
+    """The frozen registry of the trained model's classes, loaded once."""
+    return LabelRegistry(MODEL_LABELS)
+
+
+def load_registry(path, frozen=False) -> LabelRegistry:
+    """The registry saved with a dataset, or a copy of the model's for a new one."""
+    if path and os.path.isfile(path):
+        return LabelRegistry.load(path, frozen)
+    return model_registry().copy(frozen)
@@ -1,37 +1,122 @@
 import json
+import os
 import random
 
 import numpy as np
 
-import characterutil
+from atlas import AtlasTextGen
+from characterutil import BalancedWordSampler, CharacterManager
+from container import ImageMeta
+from dedup import DedupIndex
+from jsonstream import iter_json_array
+from labels import LabelRegistry, load_registry
+from visualize import DebugVisualizer
 from textutils import TextGen
 from params import *
 
 
-def generate_word(gen, file, word):
-    meta = gen.create_meta_image(word)
-    meta.save_image(f"{image_path}/image{meta.id}.png")
-    # TODO: argument no meta
-    # meta.save_image_with_boxes(f"{image_path}/image_box{meta.id}.jpg")
-    print(f"{meta.id}) {word}")
-    js = json.dumps(meta.to_dict(f"image{meta.id}.png"))
-    if meta.id == 0:
+def write_block(file, block):
+    js = json.dumps(block)
+    if file.tell() == 0:
         js = "[{}".format(js)
-    elif meta.id == batch - 1:
-        js = ",\n{}]".format(js)
     else:
-        if meta.id % 100 == 0:
+        if block["id"] % 100 == 0:
             file.flush()
         js = ",\n{}".format(js)
     file.write(js)
 
 
-def get_mean_words(gen):
+def close_json(path):
+    """
+    Close the array of a json written by an earlier (maybe interrupted) run.
+
+    Whatever follows the last complete block, like the closing bracket or a block cut off
+    by a crash, is dropped. Blocks are written one per line, so the last one is found
+    by reading the end of the file only.
+
+    Returns:
+        last_id (int): id of the last block, -1 if there are none.
+    """
+    with open(path, 'rb+') as file:
+        end = file.seek(0, os.SEEK_END)
+        pos, size = end, 1 << 16
+        while True:
+            pos = max(0, pos - size)
+            file.seek(pos)
+            tail = file.read(end - pos)
+            close = tail.rfind(b'}')
+            if pos == 0 or (close >= 0 and tail.rfind(b'\n', 0, close) >= 0):
+                break
+        if close < 0:
+            file.seek(0)
+            file.truncate()
+            file.write(b'[]')
+            return -1
+        line = tail[tail.rfind(b'\n', 0, close) + 1:close + 1].lstrip(b'[')
+        file.seek(pos + close + 1)
+        file.truncate()
+        file.write(b']')
+    return json.loads(line)['id']
+
+
+def append_json(path):
+    """Open a closed json array so write_block goes on after its last block."""
+    with open(path, 'rb+') as file:
+        end = file.seek(0, os.SEEK_END)
+        # "[]" has no blocks, write_block starts it again
+        file.truncate(0 if end <= 2 else end - 1)
+    return open(path, 'a')
+
+
+def generate_word(gen, file, word, index: DedupIndex = None, visualizer: DebugVisualizer = None,
+                  registry: LabelRegistry = None):
+    """Render and save the word, returns False if it was skipped as a duplicate."""
+    key = None
+    if index is not None:
+        key = DedupIndex.make_key(word, gen.render_options())
+        block = index.get(key)
+        if block is not None:
+            if dedup_mode == 'skip':
+                print(f"-) {word} is already generated")
+                return False
+            # Reference the existing image instead of rendering it again
+            block = dict(block, id=ImageMeta.id)
+            ImageMeta.id += 1
+            print(f"{block['id']}) {word} -> {block['image_name']}")
+            write_block(file, block)
+            return True
+    meta = gen.create_meta_image(word)
+    if visualizer is not None:
+        visualizer.submit_meta(meta)
+    if packed_storage:
+        image_name = f"image{meta.id}.npz"
+        meta.save_packed(f"{image_path}/{image_name}")
+    else:
+        image_name = f"image{meta.id}.png"
+        meta.save_image(f"{image_path}/{image_name}")
+    print(f"{meta.id}) {word}")
+    n_labels = len(registry) if registry is not None else 0
+    block = meta.to_dict(image_name, registry)
+    if registry is not None and len(registry) != n_labels:
+        # New ids are saved before the json uses them, so an interrupted run can't lose them
+        registry.save(registry_path)
+    if index is not None:
+        index.add(key, block)
+    write_block(file, block)
+    return True
+
+
+def load_words(gen):
     with open('words.csv', 'r', encoding='utf-8') as file:
         text = file.read()
         words = list(text.split('\n'))
     alphabet = gen.char_manager.get_persian_letters()
-    words = [word for word in words if all(c in alphabet for c in word)]
+    words = [word for word in words if word and all(c in alphabet for c in word)]
+    return words
+
+
+def get_mean_words(gen):
+    words = load_words(gen)
     words = np.random.choice(words, batch).tolist()
     return words
 
@@ -42,13 +127,20 @@ def get_words(gen):
     return words
 
 
-def write_letters(json_form=False):
+def get_balanced_sampler(gen):
+    """Sampler that keeps letter forms balanced, parts are split the same way as in the json"""
+    words = load_words(gen) if is_meaningful else None
+    lengths = length if isinstance(length, tuple) else (length, length)
+    return BalancedWordSampler(gen.char_manager, words, length=lengths,
+                               splitter=lambda word: gen.get_characters(word, gen.reject_unknown))
+
+
+def write_letters(registry: LabelRegistry, json_form=False):
     """
     writes the used letters for dataset as a file
     along with other files in output directory
     """
-    charman = characterutil.CharacterManager
-    letters = charman.sadiq_letters
+    letters = list(registry.labels)
     if json_form:
         # Using JSON format writes letters as unicode
         with open(letters_path + '.json', 'w') as f:
@@ -62,28 +154,93 @@ def write_letters(json_form=False):
 
 
 def main():
-    gen = TextGen(font_path, 64, ['لا', 'لله', 'ریال'])
+    gen_class = AtlasTextGen if render_engine == 'atlas' else TextGen
+    # Packed images only keep ink or background, so text is drawn without gray edges
+    gen = gen_class(font_path, 64, ['لا', 'لله', 'ریال'], anti_alias=anti_alias, binary=packed_storage)
     Path(image_path).mkdir(parents=True, exist_ok=True)
     gen.reject_unknown = True
     print("starting...")
-    with open(json_path, 'w') as file:
-        print(f"generating in: {image_path}")
-        if is_meaningful:
-            words = get_mean_words(gen)
-            print(len(words))
-            for i in range(batch):
-                generate_word(gen, file, words[i])
-        else:
-            gen.reject_unknown = not ugly_mode
-            for i in range(int(batch / 10)):
-                words = get_words(gen)
-                for word in words:
-                    generate_word(gen, file, word)
-    write_letters(json_form=False)
+    # New forms get ids after the model's classes, and the ids of earlier runs are kept
+    registry = load_registry(registry_path)
+    index = DedupIndex(dedup_path) if dedup_mode else None
+    if index is not None:
+        # Don't overwrite images of previous runs
+        ImageMeta.id = max(ImageMeta.id, index.next_id)
+        print(f"{len(index)} samples are already generated")
+    visualizer = None
+    if preview_every or preview_fraction:
+        visualizer = DebugVisualizer(preview_path, preview_every, preview_fraction)
+        print(f"previews in: {preview_path}")
+    sampler = None
+    if balanced_mode:
+        gen.reject_unknown = True
+        sampler = get_balanced_sampler(gen)
+    # With an index the run goes on with the dataset of the earlier runs instead of replacing it
+    if index is not None and os.path.isfile(json_path):
+        ImageMeta.id = max(ImageMeta.id, close_json(json_path) + 1)
+        for block in iter_json_array(json_path):
+            n = block['n']
+            # labels.json of a run from before ids were saved eagerly can be behind the json
+            if 'classes' in block:
+                registry.sync(block['parts'][:n], block['classes'][:n])
+            if sampler is not None:
+                sampler.update_parts(block['parts'][:n])
+        registry.save(registry_path)
+        file = append_json(json_path)
+    else:
+        file = open(json_path, 'w')
+    if ugly_mode:
+        # Ugly words also use forms the model doesn't have, they get their ids in list order
+        for form in CharacterManager.sadiq_letters:
+            registry.add(form)
+    try:
+        with file:
+            print(f"generating in: {image_path}")
+            if sampler is not None:
+                generated = 0
+                while generated < batch:
+                    if min_class_count and sampler.satisfied(min_class_count):
+                        print(f"every class has at least {min_class_count} samples")
+                        break
+                    word = sampler.pick()
+                    if word is None:
+                        print("no more words to generate")
+                        break
+                    # Only words that make it into the dataset are counted
+                    if generate_word(gen, file, word, index, visualizer, registry):
+                        sampler.update(word)
+                        generated += 1
+                    else:
+                        sampler.reject(word)
+            elif is_meaningful:
+                words = get_mean_words(gen)
+                print(len(words))
+                skipped = sum(not generate_word(gen, file, words[i], index, visualizer, registry)
+                              for i in range(batch))
+            else:
+                gen.reject_unknown = not ugly_mode
+                skipped = 0
+                for i in range(int(batch / 10)):
+                    words = get_words(gen)
+                    for word in words:
+                        skipped += not generate_word(gen, file, word, index, visualizer, registry)
+            if sampler is None and skipped:
+                print(f"{skipped} words were already generated and skipped")
+            file.write("]" if file.tell() else "[]")
+    finally:
+        registry.save(registry_path)
+        # The index and the last sheet of previews are kept even when a word fails
+        if index is not None:
+            index.close()
+        if visualizer is not None:
+            visualizer.close()
+    write_letters(registry, json_form=False)
     return None
 
 
 if __name__ == '__main__':
     assert not (is_meaningful and ugly_mode), "You can't have ugly and meaningful at the same time retard."
+    assert not (balanced_mode and ugly_mode), "You can't have ugly and balanced at the same time."
+    assert not (packed_storage and anti_alias), "Packed storage only keeps binary images."
     assert not (using_mask and loosebox), "You can't have masks and boxes at the same time retard."
     main()
@@ -4,19 +4,33 @@ batch = 10
 length = (3, 6)
 is_meaningful = True   # Buggy
 ugly_mode = False
+balanced_mode = False   # Balance letter forms, uses words.csv if is_meaningful
+min_class_count = 0     # Stop balanced generation early when every form has this many samples
+render_engine = 'pil'   # 'pil' shapes every word, 'atlas' composes pre-rendered glyphs with exact boxes
+anti_alias = False
+packed_storage = False  # Save images cropped to ink and bit-packed as .npz instead of .png
 using_mask = False
 loosebox = False
 save_with_detectron_format = False
+dedup_mode = None       # What to do with already generated words: 'skip', 'reference' or None to disable
+preview_every = 0       # Put every Nth image in labeled contact sheets, 0 disables
+preview_fraction = 0.   # Random fraction of images to preview when preview_every is 0
 
 im_sadiqu = 1
 if im_sadiqu:
     image_path = Path.home() / "percat_images"
     json_path = str((image_path.parent / "train_ocr.json").absolute())
     letters_path = str((image_path.parent / "used_letters").absolute())
+    dedup_path = str((image_path.parent / "dedup_index.jsonl").absolute())
+    preview_path = str((image_path.parent / "previews").absolute())
+    registry_path = str((image_path.parent / "labels.json").absolute())
     image_path = str(image_path.absolute())
     ocr_path = Path.home() / 'PycharmProjects/PerCato/'
     font_path = str((ocr_path / "b_nazanin.ttf").absolute())
 else:
     image_path = "images/"
     json_path = "final.json"
+    dedup_path = "dedup_index.jsonl"
+    preview_path = "previews/"
+    registry_path = "labels.json"
     font_path = "b_nazanin.ttf"
\ No newline at end of file
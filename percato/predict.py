@@ -1,50 +1,14 @@
 import json
+from typing import Dict, Union
 
-LABEL_MAP = {'ﺎ': 0, 'ﺐ': 1, 'ﺑ': 2, 'ﺖ': 3, 'ﺗ': 4, 'ﺚ': 5,
-             'ﺛ': 6, 'ﺞ': 7, 'ﺟ': 8, 'ﺢ': 9, 'ﺣ': 10, 'ﺦ': 11,
-             'ﺧ': 12, 'ﺪ': 13, 'ﺬ': 14, 'ﺮ': 15, 'ﺰ': 16, 'ﺲ': 17,
-             'ﺳ': 18, 'ﺶ': 19, 'ﺷ': 20, 'ﺺ': 21, 'ﺻ': 22, 'ﺾ': 23,
-             'ﺿ': 24, 'ﻂ': 25, 'ﻆ': 26, 'ﻉ': 27, 'ﻊ': 28, 'ﻋ': 29,
-             'ﻌ': 30, 'ﻍ': 31, 'ﻎ': 32, 'ﻏ': 33, 'ﻐ': 34, 'ﻒ': 35,
-             'ﻓ': 36, 'ﻖ': 37, 'ﻗ': 38, 'ﻘ': 39, 'ﻚ': 40, 'ﻛ': 41,
-             'ﻞ': 42, 'ﻟ': 43, 'ﻠ': 44, 'ﻢ': 45, 'ﻣ': 46, 'ﻦ': 47,
-             'ﻧ': 48, 'ﻩ': 49, 'ﻪ': 50, 'ﻫ': 51, 'ﻬ': 52, 'ﻮ': 53,
-             'ﯼ': 54, 'ﯾ': 55, 'ﭗ': 56, 'ﭘ': 57, 'ﭻ': 58, 'ﭼ': 59,
-             'ﮋ': 60, 'ﮓ': 61, 'ﮔ': 62, 'ﺋ': 63, 'ﺁ': 64, 'لا': 65}
-
-
-def sort_word(word: json):
-    """Use Bubble sort to sort characters based on their bbox position"""
-    for i in range(len(word)):
-        already_sorted = True
-        for j in range(len(word) - i - 1):
-            x = word[j]['bbox'][0]
-            x_next = word[j + 1]['bbox'][0]
-            if x > x_next:
-                word[j], word[j + 1] = word[j + 1], word[j]
-                already_sorted = False
-        if already_sorted:
-            break
-    return word[::-1]
-
-
-def show_word(word: json) -> list:
-    """Get characters of the word from label map"""
-    def search_keys_by_val(dict, byVal):
-        """LABEL_MAP is reversed, so we need to search by value"""
-        items_list = dict.items()
-        for item in items_list:
-            if item[1] == byVal:
-                key = item[0]
-        return key
-    sensitivity = 0.7   # Show characters you're at least 70% sure about
-    print_string = []
-    for char in word:
-        if char['score'] > sensitivity:
-            cat_id = char['category_id']
-            harf = search_keys_by_val(LABEL_MAP, cat_id)
-            print_string.append(harf)
-    return print_string
+import numpy as np
+
+import boxutils
+from labels import model_registry
+
+# Kept for code using the maps directly, labels.model_registry() is the source of both
+LABEL_MAP = model_registry().label_map()
+ID_LABEL_MAP = dict(enumerate(model_registry().labels))
 
 
 def read_output(jfile):
@@ -55,22 +19,181 @@ def read_output(jfile):
     return jdump
 
 
-def get_words(dump: json, n_words: int) -> list:
-    """Gets output.json and returns a clean list of words."""
-    words = [[]]
-    for n in range(n_words):
-        for char in dump:
-            if char['image_id'] == n:
-                words[n].append(char)
-    return words
+def results_to_arrays(results) -> Dict[str, np.ndarray]:
+    """
+    COCO results (dicts with image_id, category_id, score and XYWH bbox) as flat arrays.
+
+    Returns:
+        dict of image_ids, classes, scores and boxes, boxes converted to inclusive XYXY.
+    """
+    image_ids, classes, scores, boxes = [], [], [], []
+    for char in results:
+        image_ids.append(char['image_id'])
+        classes.append(char['category_id'])
+        scores.append(char['score'])
+        boxes.append(char['bbox'])
+    boxes = np.rint(np.asarray(boxes, dtype=float).reshape(-1, 4)).astype(np.int64)
+    return {'image_ids': np.array(image_ids, dtype=np.int64),
+            'classes': np.array(classes, dtype=np.int64),
+            'scores': np.array(scores, dtype=float),
+            'boxes': boxutils.convert(boxes, boxutils.XYWH, boxutils.XYXY)}
+
+
+def outputs_to_arrays(outputs) -> Dict[str, np.ndarray]:
+    """
+    Detector outputs (dicts of XYXY boxes, scores and classes, one per image) as flat arrays,
+    the image_id of a detection is the position of its image in outputs.
+    """
+    counts = [len(output['scores']) for output in outputs]
+    if not sum(counts):
+        return {'image_ids': np.zeros(0, np.int64), 'classes': np.zeros(0, np.int64),
+                'scores': np.zeros(0, float), 'boxes': np.zeros((0, 4), np.int64)}
+    return {'image_ids': np.repeat(np.arange(len(outputs), dtype=np.int64), counts),
+            'classes': np.concatenate([np.asarray(o['classes'], np.int64).reshape(-1) for o in outputs]),
+            'scores': np.concatenate([np.asarray(o['scores'], float).reshape(-1) for o in outputs]),
+            'boxes': np.concatenate([boxutils.as_boxes(o['boxes']) for o in outputs])}
+
+
+def take(arrays: Dict[str, np.ndarray], index) -> Dict[str, np.ndarray]:
+    return {key: value[index] for key, value in arrays.items()}
+
+
+def filter_scores(arrays, thresholds: Union[float, Dict[str, float]] = 0.7, default=0.7):
+    """
+    Drop detections under the score threshold of their class.
+
+    Args:
+        thresholds: one threshold for all classes, or form -> threshold with default for the rest.
+    """
+    if isinstance(thresholds, dict):
+        registry = model_registry()
+        per_class = np.full(len(registry), default)
+        for form, threshold in thresholds.items():
+            per_class[registry.id(form)] = threshold
+        known = (arrays['classes'] >= 0) & (arrays['classes'] < len(per_class))
+        limits = np.where(known, per_class[np.clip(arrays['classes'], 0, len(per_class) - 1)], default)
+    else:
+        limits = thresholds
+    return take(arrays, arrays['scores'] >= limits)
+
+
+def parse_thresholds(values) -> Dict[str, float]:
+    """
+    Per class thresholds from the command line: form=threshold items and/or json files of {form: threshold}.
+
+    e.g. ['لا=0.5', 'ﺑ=0.8'] or ['thresholds.json'].
+
+    Raises ValueError for unknown forms, bad numbers and unreadable files.
+    """
+    thresholds = {}
+    for value in values:
+        if '=' in value:
+            form, threshold = value.rsplit('=', 1)
+            items = {form: threshold}
+        else:
+            try:
+                with open(value, 'r', encoding='utf-8') as file:
+                    items = json.load(file)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"Can't read thresholds from {value}: {e}")
+            if not isinstance(items, dict):
+                raise ValueError(f"{value} should have a json object of form: threshold")
+        for form, threshold in items.items():
+            try:
+                thresholds[form] = float(threshold)
+            except (TypeError, ValueError):
+                raise ValueError(f"Threshold of '{form}' is not a number: {threshold!r}")
+    for form in thresholds:
+        if form not in model_registry():
+            raise ValueError(f"'{form}' is not one of the model's classes")
+    return thresholds
+
+
+def nms(arrays, iou_threshold=0.5, class_agnostic=False):
+    """
+    Greedy non-maximum suppression of all images in one pass.
+
+    Detections are grouped by image (and class unless class_agnostic) and sorted by score, the
+    IoU of every pair inside a group is computed at once. A detection is kept when no kept
+    detection before it overlaps it; this is solved by iterating over the pairs until nothing
+    changes, which takes about as many steps as the longest chain of suppressions.
+    """
+    n = len(arrays['scores'])
+    if n < 2:
+        return arrays
+    groups = arrays['image_ids'] if class_agnostic else \
+        arrays['image_ids'] * (arrays['classes'].max() + 1) + arrays['classes']
+    order = np.lexsort((-arrays['scores'], groups))
+    groups = groups[order]
+    starts = np.ones(n, '?')
+    starts[1:] = groups[1:] != groups[:-1]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+    ranks = np.arange(n) - group_start
+    # Pairs (i, j) with i before j in the same group
+    j = np.repeat(np.arange(n), ranks)
+    i = group_start[j] + (np.arange(len(j)) - np.repeat(np.cumsum(ranks) - ranks, ranks))
+    boxes = arrays['boxes'][order]
+    a, b = boxes[i], boxes[j]
+    inter_w = (np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]) + 1).clip(0)
+    inter_h = (np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]) + 1).clip(0)
+    inter = inter_w * inter_h
+    areas = boxutils.area(boxes)
+    union = areas[i] + areas[j] - inter
+    overlap = inter > iou_threshold * union
+    i, j = i[overlap], j[overlap]
+    keep = np.ones(n, '?')
+    while True:
+        suppressed = np.zeros(n, '?')
+        suppressed[j[keep[i]]] = True
+        new_keep = ~suppressed
+        if (new_keep == keep).all():
+            break
+        keep = new_keep
+    return take(arrays, np.sort(order[keep]))
+
+
+def order_rtl(arrays):
+    """Sort detections by image and then right to left, the reading order of characters."""
+    return take(arrays, np.lexsort((-arrays['boxes'][:, 0], arrays['image_ids'])))
+
+
+def postprocess(arrays, thresholds=0.7, iou_threshold=0.5, agnostic_iou_threshold=0.7, default_threshold=0.7):
+    """
+    Score filtering, class-aware then class-agnostic NMS, and right to left ordering.
+
+    thresholds is a score for all classes or form -> score, classes not in it use default_threshold.
+    """
+    arrays = filter_scores(arrays, thresholds, default_threshold)
+    arrays = nms(arrays, iou_threshold)
+    if agnostic_iou_threshold:
+        arrays = nms(arrays, agnostic_iou_threshold, class_agnostic=True)
+    return order_rtl(arrays)
+
+
+def split_words(arrays):
+    """(image_id, forms, scores) of every image, from postprocessed arrays."""
+    labels = model_registry().label_array()
+    classes = np.where((arrays['classes'] >= 0) & (arrays['classes'] < len(labels) - 1),
+                       arrays['classes'], len(labels) - 1)
+    forms = labels[classes]
+    image_ids, starts = np.unique(arrays['image_ids'], return_index=True)
+    ends = np.append(starts[1:], len(forms))
+    return [(int(image_id), forms[s:e].tolist(), arrays['scores'][s:e].tolist())
+            for image_id, s, e in zip(image_ids, starts, ends)]
 
 
-def predict(file_path, n_words: int):
-    output = read_output(file_path)
-    words = get_words(output, n_words)
-    for word in words:
-        word = sort_word(word)
-        print(show_word(word))
+def predict(file_path, n_words: int = None, corrector=None, thresholds=0.7, iou_threshold=0.5,
+            agnostic_iou_threshold=0.7, default_threshold=0.7):
+    arrays = postprocess(results_to_arrays(read_output(file_path)), thresholds, iou_threshold,
+                         agnostic_iou_threshold, default_threshold)
+    if n_words is not None:
+        arrays = take(arrays, arrays['image_ids'] < n_words)
+    for image_id, forms, scores in split_words(arrays):
+        if corrector is not None:
+            corrected, cost = corrector.correct_forms(forms, scores)
+            print(image_id, forms, '->', corrected)
+        else:
+            print(image_id, forms)
 
 
 if __name__ == "__main__":
@@ -1,21 +1,16 @@
 import argparse
+import sys
 from pathlib import Path
 
-import main
+# Heavy modules (cv2, PIL, numpy) are imported inside the commands that need them,
+# so short commands like stats or predict don't pay for them.
 
+COMMANDS = ('generate', 'stats', 'convert', 'split', 'predict', 'ocr', 'evaluate', 'verify')
+OCR_SUFFIXES = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.pdf')
 
-def run():
-    ap = argparse.ArgumentParser(description='...')
-    ap.add_argument('batch', type=int, nargs='+', help='Batch count')
-    ap.add_argument('length', type=int, nargs='?', help='Length of words (default = 3)', default=3)
-    ap.add_argument('-p', '--path', nargs='?', help='Path to save json and images', default=str(Path(__file__).parent.absolute()))
-    # TODO: implement zipping option
-    ap.add_argument('-z', '--zip', nargs='?', action='store_true', help='Images will be saved into a zip')
-    ap.add_argument('-u', '--ugly', nargs='?', action='store_true',
-                    help='Will generate ugly words, uses random alphabets (default = False')
-    ap.add_argument('-m', '--meaningful', nargs='?', action='store_true',
-                    help='Will generate only meaningful words (default = False)')
-    args = ap.parse_args()
+
+def generate(args):
+    import main
 
     path = Path(args.path)
     if not path.is_dir():
@@ -25,19 +20,235 @@ def run():
     print(f'Images will {"be" if args.zip else "NOT be"} saved into a zip file')
 
     main.batch = args.batch
-    main.length = args.length
+    main.length = (args.length, args.length)
     main.is_meaningful = args.meaningful
 
     if args.zip:
         raise NotImplementedError("zip option is not implemented yet")
     main.ugly_mode = args.ugly
+    main.balanced_mode = args.balanced
+    main.min_class_count = args.min_count
+    main.dedup_mode = None if args.dedup == 'off' else args.dedup
     assert not (main.is_meaningful and main.ugly_mode), \
         "You can't have ugly and meaningful at the same time."
     main.image_path = f"{path}{'/'}images/"
     main.json_path = f"{path}{'/'}final.json"
+    main.dedup_path = f"{path}{'/'}dedup_index.jsonl"
+    main.registry_path = f"{path}{'/'}labels.json"
+    main.preview_every = args.preview
+    main.render_engine = args.engine
+    main.packed_storage = args.packed
+    main.preview_path = f"{path}{'/'}previews/"
     print(f'Saving {args.batch} images in "{path}"')
     main.main()
 
 
+def stats(args):
+    import datacheck
+    datacheck.sum_class(args.json)
+    datacheck.sum_list(args.json)
+
+
+def convert(args):
+    import conv2dete
+    dataset_dicts = conv2dete.convert2detectron(args.path, args.input)
+    conv2dete.write_json(dataset_dicts, args.path, args.output)
+
+
+def split(args):
+    import conv2dete
+    conv2dete.slice_json(args.path, args.input)
+    conv2dete.slice_images(args.path, "val_ocr.json", "val_images.txt")
+    conv2dete.slice_images(args.path, "train_ocr.json", "train_images.txt")
+
+
+def get_corrector(args):
+    if not args.correct:
+        return None
+    from correct import Corrector, Lexicon
+    return Corrector(Lexicon.load(args.words))
+
+
+def get_thresholds(args):
+    """--score alone, or form -> threshold of --class-scores with --score for the other classes."""
+    if not args.class_scores:
+        return args.score
+    from predict import parse_thresholds
+    try:
+        return parse_thresholds(args.class_scores)
+    except ValueError as e:
+        raise SystemExit(f"percato {args.command}: error: --class-scores: {e}")
+
+
+def get_postprocess(args):
+    from functools import partial
+    from predict import postprocess
+    return partial(postprocess, thresholds=get_thresholds(args), iou_threshold=args.nms,
+                   agnostic_iou_threshold=args.agnostic_nms if args.agnostic_nms > 0 else None,
+                   default_threshold=args.score)
+
+
+def predict(args):
+    import predict as pred
+    pred.predict(args.file, args.n_words, get_corrector(args), get_thresholds(args), args.nms,
+                 args.agnostic_nms if args.agnostic_nms > 0 else None, args.score)
+
+
+def ocr(args):
+    if args.detector == 'detectron' and not (args.config and args.weights):
+        raise SystemExit("percato ocr: error: the detectron detector needs --config and --weights "
+                         "(or use --detector stub)")
+    import inference
+    if args.detector == 'detectron':
+        detector = inference.Detectron2Detector(args.config, args.weights, device=args.device)
+    else:
+        detector = inference.StubDetector()
+    pipeline = inference.OCRPipeline(detector, batch_size=args.batch_size, dpi=args.dpi,
+                                     corrector=get_corrector(args), postprocess=get_postprocess(args))
+    results = pipeline.run(args.files)
+    page = None
+    for word in results:
+        if word['page'] != page:
+            page = word['page']
+            print(f"--- page {page} ({word['file']})")
+        print(word['box'], "".join(word['text']), *(['->', word['word']] if 'word' in word else []))
+    stats = pipeline.stats
+    print(f"{stats['crops']} words in {stats['seconds']:.2f}s, "
+          f"{stats['model_seconds']:.2f}s in the detector ({stats['crops_per_second']:.1f} words/s)")
+
+
+def evaluate(args):
+    import evaluate as ev
+    report = ev.evaluate(args.ground_truth, args.predictions, iou_threshold=args.iou,
+                         score_threshold=args.score, by_id=args.by_id)
+    ev.print_report(report)
+    if args.output:
+        ev.write_report(report, args.output)
+
+
+def verify(args):
+    import verify as ver
+    summary = ver.verify(args.json, args.images, args.search, args.manifest, args.clean, args.pixels,
+                         workers=args.workers)
+    ver.print_summary(summary)
+
+
+def add_decode_arguments(parser):
+    parser.add_argument('--score', type=float, default=0.7, help='Minimum score of characters (default = 0.7)')
+    parser.add_argument('--class-scores', nargs='+', default=[], metavar='FORM=SCORE|FILE',
+                        help='Minimum scores of some classes, as form=score items or json files of '
+                             '{form: score}, --score is used for the rest')
+    parser.add_argument('--nms', type=float, default=0.5, help='IoU of class-aware NMS (default = 0.5)')
+    parser.add_argument('--agnostic-nms', type=float, default=0.7,
+                        help='IoU of class-agnostic NMS, 0 disables it (default = 0.7)')
+
+
+def add_correct_arguments(parser):
+    parser.add_argument('-c', '--correct', action='store_true',
+                        help='Correct decoded words to the closest valid word, words within one edit are always '
+                             'found, two edits only when one of them is an extra letter (default = False)')
+    parser.add_argument('--words', default=str(Path(__file__).parent / 'words.csv'),
+                        help='Valid words for --correct, the index is cached next to it (default = words.csv)')
+
+
+def get_parser():
+    ap = argparse.ArgumentParser(prog='percato', description='Farsi data generator and OCR tool')
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    gp = sub.add_parser('generate', help='Generate word images and their json')
+    gp.add_argument('batch', type=int, help='Batch count')
+    gp.add_argument('length', type=int, nargs='?', help='Length of words (default = 3)', default=3)
+    gp.add_argument('-p', '--path', nargs='?', help='Path to save json and images',
+                    default=str(Path(__file__).parent.absolute()))
+    # TODO: implement zipping option
+    gp.add_argument('-z', '--zip', action='store_true', help='Images will be saved into a zip')
+    gp.add_argument('-u', '--ugly', action='store_true',
+                    help='Will generate ugly words, uses random alphabets (default = False')
+    gp.add_argument('-m', '--meaningful', action='store_true',
+                    help='Will generate only meaningful words (default = False)')
+    gp.add_argument('-b', '--balanced', action='store_true',
+                    help='Will balance the count of letter forms in the generated words (default = False)')
+    gp.add_argument('--min-count', type=int, default=0,
+                    help='Stop balanced generation when every letter form has this many samples (default = 0)')
+    gp.add_argument('-d', '--dedup', choices=['skip', 'reference', 'off'], default='off',
+                    help='What to do with words generated before in this path, skip or reference their images; '
+                         'either one also resumes the dataset json of earlier runs (default = off)')
+    gp.add_argument('--preview', type=int, default=0, metavar='N',
+                    help='Put every Nth image with its boxes in contact sheets under previews/ (default = 0, off)')
+    gp.add_argument('-e', '--engine', choices=['pil', 'atlas'], default='pil',
+                    help='Render words with PIL or compose them from a glyph atlas (default = pil)')
+    gp.add_argument('--packed', action='store_true',
+                    help='Save images cropped and bit-packed as .npz instead of .png (default = False)')
+    gp.set_defaults(func=generate)
+
+    sp = sub.add_parser('stats', help='Show how much of each letter a generated json has')
+    sp.add_argument('json', help='Path of the generated json')
+    sp.set_defaults(func=stats)
+
+    cp = sub.add_parser('convert', help='Convert a generated json to Detectron2 format')
+    cp.add_argument('path', help='Dataset directory containing the json and images/')
+    cp.add_argument('-i', '--input', default='final-pretty.json', help='Name of the generated json')
+    cp.add_argument('-o', '--output', default='final-formatted.json', help='Name of the output json')
+    cp.set_defaults(func=convert)
+
+    slp = sub.add_parser('split', help='Split a json into val/train jsons and image lists')
+    slp.add_argument('path', help='Dataset directory containing the json')
+    slp.add_argument('-i', '--input', default='final-pretty.json', help='Name of the json to split')
+    slp.set_defaults(func=split)
+
+    pp = sub.add_parser('predict', help='Decode words from a COCO results file of the model')
+    pp.add_argument('file', help='Path of coco_instances_results.json')
+    pp.add_argument('-n', '--n-words', type=int, default=None, help='Only the first n images (default = all)')
+    add_decode_arguments(pp)
+    add_correct_arguments(pp)
+    pp.set_defaults(func=predict)
+
+    op = sub.add_parser('ocr', help='Read words of images and pdf files')
+    op.add_argument('files', nargs='+', help='Images or pdf files')
+    op.add_argument('--detector', choices=['stub', 'detectron'], default='detectron',
+                    help='stub runs the pipeline on CPU without a model, detectron needs --config and --weights '
+                         '(default = detectron)')
+    op.add_argument('--config', help='Detectron2 yaml config of the model')
+    op.add_argument('--weights', help='Trained weights of the model')
+    op.add_argument('--device', default='cuda', help='Device of the model (default = cuda)')
+    op.add_argument('--batch-size', type=int, default=16, help='Words per detector call (default = 16)')
+    op.add_argument('--dpi', type=int, default=200, help='Resolution of rendered pdf pages (default = 200)')
+    add_decode_arguments(op)
+    add_correct_arguments(op)
+    op.set_defaults(func=ocr)
+
+    ep = sub.add_parser('evaluate', help='Compare predictions with the generated ground truth')
+    ep.add_argument('ground_truth', help='The generated json')
+    ep.add_argument('predictions', help='coco_instances_results.json of the model')
+    ep.add_argument('--iou', type=float, default=0.5, help='Minimum IoU of a match (default = 0.5)')
+    ep.add_argument('--score', type=float, default=0.7, help='Minimum score of predictions (default = 0.7)')
+    ep.add_argument('--by-id', action='store_true',
+                    help='Match images by block id instead of position in the json (default = False)')
+    ep.add_argument('-o', '--output', help='Write the report with the confusion matrix as json')
+    ep.set_defaults(func=evaluate)
+
+    vp = sub.add_parser('verify', help='Check images and boxes of a generated json before training')
+    vp.add_argument('json', help='The generated json')
+    vp.add_argument('-i', '--images', help='Directory of the images (default = images/ next to the json)')
+    vp.add_argument('-s', '--search', nargs='*', default=[],
+                    help='Directories to look for missing images in, e.g. where slice_images.sh moved them')
+    vp.add_argument('-m', '--manifest', help='Where to write the manifest (default = <json>.manifest.jsonl)')
+    vp.add_argument('--clean', help='Write the json with repairs applied and bad images left out')
+    vp.add_argument('--pixels', action='store_true',
+                    help='Also decode the images to find boxes without ink, slower (default = False)')
+    vp.add_argument('-w', '--workers', type=int, default=None, help='Threads reading the images')
+    vp.set_defaults(func=verify)
+    return ap
+
+
+def run(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        # `percato image.png` means ocr and old style `percato 100 4` means generate
+        argv.insert(0, 'ocr' if argv[0].lower().endswith(OCR_SUFFIXES) else 'generate')
+    args = get_parser().parse_args(argv)
+    args.func(args)
+
+
 if __name__ == '__main__':
     run()
@@ -0,0 +1,129 @@
+"""
+Cuts binarized pages (white text on black) into word boxes for the detector.
+
+Lines come from the horizontal projection profile, words from the gaps of the vertical
+profile of every line, and connected components give the words their tight boxes.
+Everything works on whole-page arrays, there are no per-pixel loops.
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+Segmentation = namedtuple('Segmentation', ['boxes', 'lines', 'line_boxes'])
+
+
+def runs(mask: np.ndarray):
+    """Start and (exclusive) end indexes of the True runs along the last axis, with row indexes for 2D masks."""
+    mask = np.atleast_2d(mask)
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), '?')
+    padded[:, 1:-1] = mask
+    diff = np.diff(padded.astype(np.int8), axis=1)
+    rows, starts = np.nonzero(diff == 1)
+    _, ends = np.nonzero(diff == -1)
+    return rows, starts, ends
+
+
+def find_lines(binary: np.ndarray, min_gap=3, small_ratio=0.35):
+    """
+    Text lines of a page as (start, end) row ranges, end exclusive.
+
+    Bands of the projection profile closer than min_gap are joined, and bands shorter than
+    small_ratio of the median band (dots and diacritics) are joined to their closer neighbour.
+    """
+    profile = (binary > 0).any(axis=1)
+    _, starts, ends = runs(profile)
+    if len(starts) < 2:
+        return starts, ends
+    heights = ends - starts
+    gaps = starts[1:] - ends[:-1]
+    small = heights < small_ratio * np.median(heights)
+    prev_gaps = np.concatenate([[np.inf], gaps[:-1]])
+    next_gaps = np.concatenate([gaps[1:], [np.inf]])
+    join = (gaps < min_gap) | (small[:-1] & (gaps <= prev_gaps)) | (small[1:] & (gaps <= next_gaps))
+    groups = np.concatenate([[0], np.cumsum(~join)])
+    firsts = np.nonzero(np.diff(groups, prepend=-1))[0]
+    return starts[firsts], np.maximum.reduceat(ends, firsts)
+
+
+def find_words(binary: np.ndarray, line_starts, line_ends, word_gap=None, gap_ratio=0.2):
+    """
+    Word column ranges of every line from the gaps of the vertical profiles.
+
+    Args:
+        word_gap (int): smallest gap between two words, by default gap_ratio of the line height.
+
+    Returns:
+        lines, starts, ends (np.array): line index and (start, end) column range of each word,
+            end exclusive, ordered by line and then left to right.
+    """
+    if not len(line_starts):
+        empty = np.zeros(0, np.int64)
+        return empty, empty, empty
+    marks = np.zeros(binary.shape[0] + 1, np.int64)
+    np.add.at(marks, line_starts, 1)
+    np.add.at(marks, line_ends, -1)
+    in_line = np.cumsum(marks[:-1]) > 0
+    # (n_lines, width) vertical profiles, rows between lines are left out
+    profiles = np.add.reduceat((binary > 0) & in_line[:, None], line_starts, axis=0) > 0
+    lines, starts, ends = runs(profiles)
+    if not len(starts):
+        return lines, starts, ends
+    heights = (line_ends - line_starts)[lines]
+    threshold = np.full(len(starts), word_gap) if word_gap else np.maximum(2, gap_ratio * heights)
+    new_word = np.ones(len(starts), '?')
+    new_word[1:] = (lines[1:] != lines[:-1]) | (starts[1:] - ends[:-1] >= threshold[1:])
+    firsts = np.nonzero(new_word)[0]
+    return lines[firsts], starts[firsts], np.maximum.reduceat(ends, firsts)
+
+
+def segment_words(binary: np.ndarray, word_gap=None, min_area=2) -> Segmentation:
+    """
+    Word boxes of a binarized page.
+
+    Returns:
+        Segmentation with boxes (N, 4) inclusive XYXY in page coordinates and lines (N,) line
+        index of each word, in reading order (lines top to bottom, words right to left),
+        and line_boxes (L, 4) of the lines.
+    """
+    line_starts, line_ends = find_lines(binary)
+    lines, starts, ends = find_words(binary, line_starts, line_ends, word_gap)
+    empty = Segmentation(np.zeros((0, 4), np.int64), np.zeros(0, np.int64), np.zeros((0, 4), np.int64))
+    if not len(starts):
+        return empty
+    # Components get the line of their center row and the word of their center column
+    n, _, stats, centroids = cv2.connectedComponentsWithStats((binary > 0).astype('uint8'), connectivity=8)
+    stats, centroids = stats[1:], centroids[1:]
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_area
+    stats, centroids = stats[keep], centroids[keep]
+    cy, cx = centroids[:, 1].astype(np.int64), centroids[:, 0].astype(np.int64)
+    comp_line = np.searchsorted(line_starts, cy, side='right') - 1
+    comp_line = np.clip(comp_line, 0, len(line_starts) - 1)
+    # Words are sorted by (line, start), so one searchsorted over a combined key finds them
+    key = lines * (binary.shape[1] + 1) + starts
+    comp_word = np.searchsorted(key, comp_line * (binary.shape[1] + 1) + cx, side='right') - 1
+    valid = (comp_word >= 0) & (lines[np.clip(comp_word, 0, None)] == comp_line)
+    comp_word = comp_word[valid]
+    x, y, w, h = stats[valid, :4].T
+    boxes = np.empty((len(starts), 4), np.int64)
+    boxes[:, :2] = np.iinfo(np.int64).max
+    boxes[:, 2:] = -1
+    np.minimum.at(boxes[:, 0], comp_word, x)
+    np.minimum.at(boxes[:, 1], comp_word, y)
+    np.maximum.at(boxes[:, 2], comp_word, x + w - 1)
+    np.maximum.at(boxes[:, 3], comp_word, y + h - 1)
+    found = boxes[:, 2] >= 0
+    boxes, lines = boxes[found], lines[found]
+    # Reading order: lines top to bottom, words right to left
+    order = np.lexsort((-boxes[:, 2], lines))
+    line_boxes = np.stack([np.zeros(len(line_starts), np.int64), line_starts,
+                           np.full(len(line_starts), binary.shape[1] - 1), line_ends - 1], axis=1)
+    return Segmentation(boxes[order], lines[order], line_boxes)
+
+
+def crop_words(binary: np.ndarray, boxes, margin=(4, 20)):
+    """Crops of the words padded like TextGen.create_image pads its text."""
+    top, side = margin[1] // 2, margin[0] // 2
+    padded = cv2.copyMakeBorder(binary, top, top, side, side, cv2.BORDER_CONSTANT, value=0)
+    # A box in the page is the same box in the padded page shifted by the margin, plus the margin around it
+    return [padded[y0:y1 + 1 + 2 * top, x0:x1 + 1 + 2 * side] for x0, y0, x1, y1 in boxes]
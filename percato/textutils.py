@@ -1,11 +1,13 @@
-from functools import reduce
-from re import finditer
-from typing import List, Tuple, Iterable
+import os
+import re
+from functools import reduce, lru_cache
+from typing import List, Tuple, Iterable, FrozenSet
 from itertools import groupby
 
 import cv2
 from PIL import ImageDraw, ImageFont
 
+import boxutils
 from characterutil import *
 from container import *
 from params import using_mask, loosebox
@@ -29,20 +31,35 @@ class TextGen:
         font_path (str): absolute path for the .ttf font file.
         font_size (int): font size for the text.
         exceptions: exception words, e.g. لا.
+        binary (bool): draw text without gray edges (PIL anti-aliases it even with anti_alias off),
+            needed for storing images packed without losing pixels.
     """
 
-    def __init__(self, font_path, font_size, exceptions: Iterable[str] = None, anti_alias=False, reject_unknown=True):
+    def __init__(self, font_path, font_size, exceptions: Iterable[str] = None, anti_alias=False, reject_unknown=True,
+                 binary=False):
         self.char_manager = CharacterManager()
+        self.font_path = font_path
+        self.font_size = font_size
         self.font = ImageFont.truetype(font_path, size=font_size, encoding='utf-8')
         self._dummy = ImageDraw.Draw(Image.new('L', (0, 0)))
-        self.exceptions = set(exceptions) if exceptions else set()
+        self.exceptions = exceptions
         self.anti_alias = anti_alias
         self.reject_unknown = reject_unknown
+        self.binary = binary
+
+    def render_options(self) -> dict:
+        """Everything besides the text that changes the generated image and its metadata."""
+        options = {'font': os.path.basename(self.font_path), 'size': self.font_size, 'anti_alias': self.anti_alias,
+                   'exceptions': sorted(self.exceptions), 'reject_unknown': self.reject_unknown,
+                   'mask': using_mask, 'loosebox': loosebox}
+        if self.binary:
+            # Only set when on, so dedup keys of earlier datasets stay the same
+            options['binary'] = True
+        return options
 
     def create_meta_image(self, text):
         """Generates metadata for ImageMeta class to use"""
-        image = self.create_image(text)
-        boxes = self.get_boxes(image, text)
+        image, boxes = self.render(text)
         parts = self.get_characters(text, self.reject_unknown)
         # visible_parts = self.get_visible_parts(text)
         if using_mask:
@@ -63,6 +80,11 @@ class TextGen:
                 meta = ImageMeta(text, image, parts, boxes)
         return meta
 
+    def render(self, text):
+        """Image of the text and its character boxes, in left to right order."""
+        image = self.create_image(text)
+        return image, self.get_boxes(image, text)
+
     def create_image(self, text):
         """Generates image by given font and text"""
         size = tuple(np.add(self.get_size(text), (4, 20)))
@@ -70,6 +92,8 @@ class TextGen:
         if self.anti_alias:
             image = image.resize(image.size, resample=Image.ANTIALIAS)
         d = ImageDraw.Draw(image)
+        if self.binary:
+            d.fontmode = "1"
         d.text((0, 10), text, "white", font=self.font, direction='rtl', language='fa-IR')
         return np.array(image)
 
@@ -207,36 +231,33 @@ class TextGen:
         widths.append(width - 1)
         return widths
 
+    @property
+    def exceptions(self) -> FrozenSet[str]:
+        return self._exceptions
+
+    @exceptions.setter
+    def exceptions(self, exceptions: Iterable[str]):
+        """Compiles the exceptions once, longest first so e.g. لله wins over a shorter exception inside it."""
+        self._exceptions = frozenset(e for e in exceptions if e) if exceptions else frozenset()
+        ordered = sorted(self._exceptions, key=lambda e: (-len(e), e))
+        self._exception_pattern = re.compile("|".join(map(re.escape, ordered))) if ordered else None
+        self._exception_spans = lru_cache(maxsize=65536)(self._match_exceptions)
+
+    def _match_exceptions(self, text) -> Tuple[Tuple[int, int], ...]:
+        return tuple((match.start(), match.end()) for match in self._exception_pattern.finditer(text))
+
     def find_exceptions(self, text) -> List[Tuple[int, int]]:
-        if not self.exceptions:
+        if self._exception_pattern is None:
             return []
-        exceptions = [(match.start(), match.end()) for match in finditer("|".join(self.exceptions), text)]
-        return exceptions
+        return list(self._exception_spans(text))
 
     def loose(self, y0, y1, shape, value):
-        h = shape if type(shape) is int else shape[1]
-
-        def clip(num):
-            return int(np.clip(num, 0, h))
-
-        if type(value) is int:
-            y0 -= value
-            y1 += value
-        elif type(value) is float:
-            y0 /= value
-            y1 *= value
-        else:
-            raise TypeError(f'Unknown type {type(value)}')
-        return clip(y0), clip(y1)
+        (_, y0, _, y1), = boxutils.loose([(0, y0, 0, y1)], shape, value)
+        return int(y0), int(y1)
 
     def loose_boxes(self, boxes, shape, value):
-        lboxes = []
-        for box in boxes:
-            lbox = [None] * 4
-            lbox[0], lbox[2] = box[0], box[2]
-            lbox[1], lbox[3] = self.loose(box[1], box[3], shape, value)
-            lboxes.append(lbox)
-        return tuple(lboxes)
+        """Loosens the boxes vertically, all at once."""
+        return tuple(boxutils.loose(boxes, shape, value).tolist())
 
 
 def binary_mask_to_rle(binary_mask):
@@ -0,0 +1,242 @@
+"""
+Checks a generated dataset before training: missing or moved image files, images whose size
+disagrees with the json, boxes out of their image and (optionally) boxes without ink.
+
+The json is streamed in chunks. Annotation checks run on the boxes of a whole chunk at once,
+file checks run on a thread pool and read only the image headers unless pixels are asked for.
+Problems go to a jsonl manifest with one line per bad image, saying whether it can be repaired
+(and how) or has to be excluded.
+"""
+import json
+import os
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import boxutils
+from container import load_packed
+from jsonstream import iter_json_array
+
+MISSING = 'missing'        # the image file is nowhere to be found
+MOVED = 'moved'            # the image is in one of the search directories, e.g. after slice_images.sh
+UNREADABLE = 'unreadable'  # the file exists but its header can't be read
+SIZE = 'size'              # the image size disagrees with width/height of the json
+BOUNDS = 'bounds'          # a box is out of its image or has negative size
+COUNT = 'count'            # n is more than the parts or boxes of the block
+EMPTY = 'empty'            # a box has (almost) no ink, what get_boxes fails on while generating
+
+
+def read_shape(path):
+    """(height, width) of an image from its header, without decoding the pixels."""
+    if path.endswith('.npz'):
+        # Members of an npz are read one by one, the packed bits stay on disk
+        with np.load(path) as data:
+            return tuple(int(i) for i in data['shape'][:2])
+    with Image.open(path) as image:
+        return image.height, image.width
+
+
+def read_ink(path):
+    """Ink mask (white text on black) of an image."""
+    if path.endswith('.npz'):
+        packed, _ = load_packed(path)
+        return packed.to_array() > 0
+    with Image.open(path) as image:
+        return np.asarray(image.convert('L')) > 0
+
+
+def box_ink(ink: np.ndarray, boxes) -> np.ndarray:
+    """Ink pixel count inside each (inclusive XYXY) box, from one integral image."""
+    boxes = boxutils.clip(boxes, ink.shape)
+    integral = np.zeros((ink.shape[0] + 1, ink.shape[1] + 1), np.int64)
+    integral[1:, 1:] = ink.cumsum(axis=0).cumsum(axis=1)
+    x0, y0, x1, y1 = boxes.T
+    return integral[y1 + 1, x1 + 1] - integral[y0, x1 + 1] - integral[y1 + 1, x0] + integral[y0, x0]
+
+
+def find_image(name, image_dir, search_dirs=()):
+    """Path of the image and whether it was found outside image_dir, None if it's nowhere."""
+    path = os.path.join(image_dir, name)
+    if os.path.isfile(path):
+        return path, False
+    for directory in search_dirs:
+        moved = os.path.join(directory, os.path.basename(name))
+        if os.path.isfile(moved):
+            return moved, True
+    return None, False
+
+
+def check_file(name, image_dir, search_dirs=(), boxes=None, min_ink=0):
+    """
+    File checks of one image, run on the thread pool.
+
+    Returns:
+        path (str): where the image is, None if missing.
+        moved (bool): found in a search directory.
+        shape (tuple): (height, width) of the image, None if unreadable.
+        empty (int): boxes with less than min_ink ink pixels, only counted when min_ink > 0.
+    """
+    path, moved = find_image(name, image_dir, search_dirs)
+    shape, empty = None, 0
+    if path is not None:
+        try:
+            shape = read_shape(path)
+            if min_ink and boxes is not None and len(boxes):
+                empty = int((box_ink(read_ink(path), boxes) < min_ink).sum())
+        except Exception:
+            shape = None
+    return path, moved, shape, empty
+
+
+def check_files(names, image_dir, search_dirs=(), boxes=None, min_ink=0):
+    """check_file of a batch of images."""
+    boxes = boxes if boxes is not None else [None] * len(names)
+    return [check_file(name, image_dir, search_dirs, b, min_ink) for name, b in zip(names, boxes)]
+
+
+def check_annotations(blocks):
+    """
+    Vectorized checks of the boxes of a chunk of blocks.
+
+    Returns:
+        counts (np.array): boxes of each block, -1 if n doesn't fit its parts and boxes.
+        boxes (np.array): (sum(counts), 4) boxes of the valid blocks.
+        bounds (np.array): whether every box of each block is inside its width/height.
+    """
+    counts = np.array([block['n'] if block['n'] <= min(len(block['parts']), len(block['boxes'])) else -1
+                       for block in blocks], np.int64)
+    valid = np.maximum(counts, 0)
+    boxes = boxutils.as_boxes([box for block, n in zip(blocks, valid) for box in block['boxes'][:n]])
+    shapes = np.repeat([[block['height'], block['width']] for block in blocks], valid, axis=0).reshape(-1, 2)
+    owner = np.repeat(np.arange(len(blocks)), valid)
+    bad = np.bincount(owner[~boxutils.in_bounds(boxes, shapes)], minlength=len(blocks))
+    return counts, boxes, bad == 0
+
+
+def diagnose(block, counts, bounds, file_result, fits_actual):
+    """Issues of one block, the action ('repair', 'exclude' or None if fine) and the fields a repair changes."""
+    path, moved, shape, empty = file_result
+    issues, fix = [], {}
+    if counts < 0:
+        issues.append(COUNT)
+    if path is None:
+        issues.append(MISSING)
+    elif moved:
+        issues.append(MOVED)
+        fix['image_name'] = os.path.abspath(path)
+    if path is not None and shape is None:
+        issues.append(UNREADABLE)
+    if shape is not None and shape != (block['height'], block['width']):
+        issues.append(SIZE)
+        fix['height'], fix['width'] = shape
+    # With a wrong size the json's width/height get replaced, so the boxes have to fit the real image
+    if not (fits_actual if SIZE in issues else bounds):
+        issues.append(BOUNDS)
+    if empty:
+        issues.append(EMPTY)
+    if not issues:
+        return issues, None, None
+    # A wrong size is fine to repair if the boxes fit the real image, a moved file only needs its path
+    repairable = not set(issues) - {MOVED, SIZE}
+    return issues, ('repair' if repairable else 'exclude'), (fix if repairable else None)
+
+
+def verify(json_path, image_dir=None, search_dirs=(), manifest_path=None, clean_path=None, pixels=False,
+           min_ink=4, workers=None, chunk_size=4096, batch_size=64):
+    """
+    Check every image of a generated json.
+
+    Args:
+        json_path (str): the generated json.
+        image_dir (str): directory the image names are relative to (default: images/ next to the json).
+        search_dirs (list): directories to look for missing images in, like the ones slice_images.sh moved them to.
+        manifest_path (str): jsonl with one line per bad image (default: <json>.manifest.jsonl).
+        clean_path (str): if given, the json is written here with repairs applied and bad images left out.
+        pixels (bool): decode images to find boxes with less than min_ink ink pixels, much slower than headers.
+        workers (int): threads of the file checks (default: ThreadPoolExecutor's).
+
+    Returns:
+        summary (dict): number of images, repairs, exclusions and of each issue.
+    """
+    image_dir = image_dir if image_dir else os.path.join(os.path.dirname(os.path.abspath(json_path)), 'images')
+    manifest_path = manifest_path if manifest_path else os.path.splitext(json_path)[0] + '.manifest.jsonl'
+    min_ink = min_ink if pixels else 0
+    summary = Counter()
+
+    def chunks():
+        chunk = []
+        for block in iter_json_array(json_path):
+            chunk.append(block)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def submit(pool, blocks):
+        counts, boxes, bounds = check_annotations(blocks)
+        starts = np.concatenate([[0], np.cumsum(np.maximum(counts, 0))])
+        # A task per batch of images, a future per image costs more than reading its header
+        futures = [pool.submit(check_files, [block['image_name'] for block in blocks[i:i + batch_size]],
+                               image_dir, search_dirs,
+                               [boxes[starts[j]:starts[j + 1]] for j in range(i, min(i + batch_size, len(blocks)))],
+                               min_ink) for i in range(0, len(blocks), batch_size)]
+        return blocks, counts, boxes, starts, bounds, futures
+
+    def finish(blocks, counts, boxes, starts, bounds, futures):
+        results = [result for future in futures for result in future.result()]
+        # Boxes against the real image sizes, to tell if a size mismatch can be repaired
+        actual = np.array([r[2] if r[2] is not None else (b['height'], b['width'])
+                           for b, r in zip(blocks, results)], np.int64).reshape(-1, 2)
+        owner = np.repeat(np.arange(len(blocks)), np.diff(starts))
+        out = boxutils.in_bounds(boxes, actual[owner])
+        fits_actual = np.bincount(owner[~out], minlength=len(blocks)) == 0
+        for i, block in enumerate(blocks):
+            issues, action, fix = diagnose(block, counts[i], bounds[i], results[i], fits_actual[i])
+            yield block, issues, action, fix
+
+    clean = open(clean_path, 'w', encoding='utf-8') if clean_path else None
+    try:
+        with open(manifest_path, 'w', encoding='utf-8') as manifest, ThreadPoolExecutor(workers) as pool:
+            # The next chunk is read and submitted while the workers are busy with the current one
+            pending = deque()
+            index = 0
+            for chunk in chunks():
+                pending.append(submit(pool, chunk))
+                if len(pending) < 2:
+                    continue
+                index = _write(finish(*pending.popleft()), index, manifest, clean, summary)
+            while pending:
+                index = _write(finish(*pending.popleft()), index, manifest, clean, summary)
+        if clean is not None:
+            clean.write("]" if clean.tell() else "[]")
+    finally:
+        if clean is not None:
+            clean.close()
+    summary['images'] = index
+    return dict(summary)
+
+
+def _write(checked, index, manifest, clean, summary):
+    for block, issues, action, fix in checked:
+        if action is not None:
+            manifest.write(json.dumps({'index': index, 'id': block.get('id'), 'image_name': block['image_name'],
+                                       'issues': issues, 'action': action, 'fix': fix}, ensure_ascii=False) + "\n")
+            summary[action] += 1
+            summary.update(issues)
+        if clean is not None and action != 'exclude':
+            clean.write(("[" if clean.tell() == 0 else ",\n") + json.dumps(dict(block, **(fix or {}))))
+        index += 1
+        if index % 100000 == 0:
+            print(f"{index} images checked, {summary['exclude']} to exclude, {summary['repair']} to repair")
+    return index
+
+
+def print_summary(summary):
+    print(f"images: {summary.get('images', 0)}  repair: {summary.get('repair', 0)}  "
+          f"exclude: {summary.get('exclude', 0)}")
+    for issue in (MISSING, MOVED, UNREADABLE, SIZE, BOUNDS, COUNT, EMPTY):
+        if summary.get(issue):
+            print(f"{issue}\t{summary[issue]}")
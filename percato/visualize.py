@@ -0,0 +1,149 @@
+import queue
+import random
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import ImageColor, Image
+
+import boxutils
+
+
+def draw_boxes(image: np.ndarray, boxes, color="yellow") -> np.ndarray:
+    """
+    Draw box edges on a gray image, all boxes at once.
+
+    Args:
+        image (np.array): (height, width) gray image.
+        boxes: (N, 4) inclusive XYXY boxes.
+        color (str): the color of the edges.
+
+    Returns:
+        (height, width, 3) RGB image.
+    """
+    h, w = image.shape
+    rgb = np.repeat(image[..., np.newaxis], 3, axis=2)
+    boxes = boxutils.clip(boxes, (h, w))
+    if not len(boxes):
+        return rgb
+    x0, y0, x1, y1 = boxes.T
+    xs, ys = np.arange(w), np.arange(h)
+    in_x = (xs >= x0[:, None]) & (xs <= x1[:, None])
+    in_y = (ys >= y0[:, None]) & (ys <= y1[:, None])
+    edges = np.zeros((h, w), '?')
+    np.logical_or.at(edges, y0, in_x)
+    np.logical_or.at(edges, y1, in_x)
+    np.logical_or.at(edges.T, x0, in_y)
+    np.logical_or.at(edges.T, x1, in_y)
+    rgb[edges] = ImageColor.getrgb(color)
+    return rgb
+
+
+def make_sheet(images, columns, pad=2, background=(40, 40, 40)) -> np.ndarray:
+    """Tile RGB images of different sizes into one contact sheet."""
+    rows = -(-len(images) // columns)
+    cell_h = max(im.shape[0] for im in images) + pad
+    cell_w = max(im.shape[1] for im in images) + pad
+    sheet = np.empty((rows * cell_h + pad, columns * cell_w + pad, 3), 'uint8')
+    sheet[:] = background
+    for i, im in enumerate(images):
+        r, c = divmod(i, columns)
+        y, x = r * cell_h + pad, c * cell_w + pad
+        sheet[y:y + im.shape[0], x:x + im.shape[1]] = im
+    return sheet
+
+
+class DebugVisualizer:
+    """
+    Writes labeled previews of a sample of the generated images as contact sheets.
+
+    Only every Nth image (or a random fraction) is kept, drawing and writing happen in
+    a background thread, and many words share one sheet image.
+
+    Args:
+        out_dir (str): directory of the sheets.
+        every (int): keep every Nth submitted image, 0 to use fraction instead.
+        fraction (float): probability of keeping an image when every is 0.
+        columns (int): images per row of a sheet.
+        rows (int): rows of a sheet, a sheet is written when it is full.
+        color (str): the color of boxes.
+    """
+
+    def __init__(self, out_dir, every=100, fraction=0., columns=4, rows=8, color="yellow", seed=None):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.every = every
+        self.fraction = fraction
+        self.columns = columns
+        self.per_sheet = columns * rows
+        self.color = color
+        self._random = random.Random(seed)
+        self._seen = 0
+        self._sheets = 0
+        self._pending = []
+        self._error = None
+        self._queue = queue.Queue(maxsize=self.per_sheet * 2)
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def wants(self) -> bool:
+        """Whether the next submitted image is going to be previewed."""
+        if self.every:
+            return self._seen % self.every == 0
+        return self._random.random() < self.fraction
+
+    def submit(self, image: np.ndarray, boxes) -> bool:
+        """Queue an image for preview if it's sampled, returns whether it was."""
+        self._raise_error()
+        sampled = self.wants()
+        self._seen += 1
+        if sampled:
+            self._queue.put((image, boxes))
+        return sampled
+
+    def submit_meta(self, meta) -> bool:
+        return self.submit(meta.image, meta.boxes)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                # After an error the queue is still drained, so submit never blocks on a full queue
+                if self._error is None:
+                    if item is None:
+                        self._write_sheet()
+                    else:
+                        self._pending.append(draw_boxes(*item, color=self.color))
+                        if len(self._pending) >= self.per_sheet:
+                            self._write_sheet()
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+            if item is None:
+                return
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError("Writing previews failed") from self._error
+
+    def _write_sheet(self):
+        if not self._pending:
+            return None
+        sheet = make_sheet(self._pending, self.columns)
+        Image.fromarray(sheet).save(self.out_dir / f"sheet{self._sheets}.png")
+        self._sheets += 1
+        self._pending = []
+
+    def close(self):
+        """Write the last sheet and stop the worker, raises if the worker failed."""
+        if self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
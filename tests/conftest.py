@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The package modules import each other as top level modules, like run.py does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'percato'))
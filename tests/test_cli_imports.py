@@ -0,0 +1,53 @@
+"""
+Import-time budget of the CLI: help and light commands must not load the image libraries.
+
+Each case runs `python -X importtime percato/run.py ...` in a fresh interpreter and reads the
+report it prints to stderr.
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PACKAGE = Path(__file__).resolve().parent.parent / 'percato'
+
+# Startup of the interpreter and argparse are ~10 ms, the rest is headroom for slow machines
+BUDGET_US = 150_000
+HEAVY = ('cv2', 'PIL', 'numpy', 'torch', 'detectron2', 'fitz')
+
+
+def import_times(*args):
+    """module -> cumulative import time (us) of every module imported by the command."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', str(PACKAGE / 'run.py'), *args],
+                            cwd=PACKAGE, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Top level imports have no indentation, their cumulative times add up to the total
+        times[name.rstrip()] = int(cumulative)
+    return times
+
+
+def total_time(times):
+    return sum(t for name, t in times.items() if not name.startswith(' '))
+
+
+@pytest.mark.parametrize('command', [['predict', '-h'], ['stats', '-h'], ['-h']])
+def test_help_imports_no_image_libraries(command):
+    times = import_times(*command)
+    loaded = {name.strip().split('.')[0] for name in times}
+    assert not loaded & set(HEAVY), f"{' '.join(command)} imports {sorted(loaded & set(HEAVY))}"
+    assert total_time(times) < BUDGET_US, f"{' '.join(command)} takes {total_time(times)} us to import"
+
+
+def test_light_modules_import_no_image_libraries():
+    # predict and stats load numpy for their arrays, but never the image libraries
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import predict, datacheck, correct'],
+                            cwd=PACKAGE, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    loaded = {line.split('|')[-1].strip().split('.')[0] for line in result.stderr.splitlines()}
+    assert not loaded & {'cv2', 'PIL'}
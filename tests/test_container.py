@@ -0,0 +1,46 @@
+"""Round trip of the bit-packed word images."""
+import numpy as np
+import pytest
+
+from container import PackedImage, load_packed, save_packed
+
+
+def random_image(rng, shape=(40, 90)):
+    image = np.zeros(shape, 'uint8')
+    y, x = rng.integers(0, shape[0] // 2), rng.integers(0, shape[1] // 2)
+    h, w = rng.integers(1, shape[0] - y), rng.integers(1, shape[1] - x)
+    # Odd crop sizes, the packed bits don't end on a byte
+    image[y:y + h, x:x + w] = (rng.random((h, w)) < 0.4) * np.uint8(255)
+    image[y, x] = image[y + h - 1, x + w - 1] = 255
+    return image
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_pack_round_trip(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    image = random_image(rng)
+    packed = PackedImage.from_array(image)
+    assert packed.nbytes <= image.size // 8 + 1
+    ys, xs = np.nonzero(image)
+    boxes = np.array([[xs.min(), ys.min(), xs.max(), ys.max()], [xs.min(), ys.min(), xs.min(), ys.min()]])
+    save_packed(tmp_path / 'word.npz', packed, boxes)
+    loaded, loaded_boxes = load_packed(tmp_path / 'word.npz')
+    assert loaded.shape == image.shape
+    assert np.array_equal(loaded.to_array(), image)
+    assert np.array_equal(loaded_boxes, boxes)
+
+
+def test_pack_empty_image():
+    image = np.zeros((10, 20), 'uint8')
+    packed = PackedImage.from_array(image)
+    assert np.array_equal(packed.to_array(), image)
+
+
+def packed_pixels(image, threshold):
+    return PackedImage.from_array(image, threshold).to_array()
+
+
+def test_pack_gray_becomes_ink():
+    image = np.array([[0, 30], [255, 0]], 'uint8')
+    assert packed_pixels(image, 0).tolist() == [[0, 255], [255, 0]]
+    assert packed_pixels(image, 100).tolist() == [[0, 0], [255, 0]]
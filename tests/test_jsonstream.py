@@ -0,0 +1,24 @@
+"""Streaming the objects of a json array in chunks."""
+import json
+
+import pytest
+
+from jsonstream import iter_json_array
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1 << 20])
+def test_stream_objects(tmp_path, chunk_size):
+    blocks = [{'id': i, 'text': 'متن' * i, 'boxes': [[i, 0, i + 3, 12345]]} for i in range(30)]
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps(blocks, ensure_ascii=False), encoding='utf-8')
+    assert list(iter_json_array(path, chunk_size)) == blocks
+
+
+@pytest.mark.parametrize('content', ['[12345, 678]', '[{"id": 0}, 5]', '{"id": 0}', '', '[{"id": 0},'])
+@pytest.mark.parametrize('chunk_size', [3, 1 << 20])
+def test_stream_rejects(tmp_path, content, chunk_size):
+    # Scalars would be split at chunk boundaries, they are refused instead
+    path = tmp_path / 'data.json'
+    path.write_text(content)
+    with pytest.raises(ValueError):
+        list(iter_json_array(path, chunk_size))
@@ -0,0 +1,61 @@
+"""The vectorized predict.nms against a plain greedy NMS, one detection at a time."""
+import numpy as np
+import pytest
+
+from predict import nms
+
+
+def greedy_nms(arrays, iou_threshold, class_agnostic):
+    """Indexes kept by the textbook greedy NMS, in their original order."""
+    boxes, scores = arrays['boxes'], arrays['scores']
+    groups = list(zip(arrays['image_ids'], np.zeros_like(arrays['classes']) if class_agnostic else arrays['classes']))
+    kept = []
+    for i in sorted(range(len(scores)), key=lambda i: -scores[i]):
+        overlapped = False
+        for k in kept:
+            if groups[k] != groups[i]:
+                continue
+            a, b = boxes[k], boxes[i]
+            inter = max(0, min(a[2], b[2]) - max(a[0], b[0]) + 1) * max(0, min(a[3], b[3]) - max(a[1], b[1]) + 1)
+            union = (a[2] - a[0] + 1) * (a[3] - a[1] + 1) + (b[2] - b[0] + 1) * (b[3] - b[1] + 1) - inter
+            if inter > iou_threshold * union:
+                overlapped = True
+                break
+        if not overlapped:
+            kept.append(i)
+    return sorted(kept)
+
+
+def random_arrays(rng, n, images=3, classes=4):
+    x0, y0 = rng.integers(0, 60, n), rng.integers(0, 30, n)
+    w, h = rng.integers(1, 25, n), rng.integers(1, 25, n)
+    return {'image_ids': rng.integers(0, images, n),
+            'classes': rng.integers(0, classes, n),
+            # Distinct scores, ties would make the greedy order ambiguous
+            'scores': rng.permutation(n) / n,
+            'boxes': np.stack([x0, y0, x0 + w - 1, y0 + h - 1], axis=1)}
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('class_agnostic', [False, True])
+@pytest.mark.parametrize('iou_threshold', [0.3, 0.5, 0.8])
+def test_nms_matches_greedy(seed, class_agnostic, iou_threshold):
+    rng = np.random.default_rng(seed)
+    arrays = random_arrays(rng, int(rng.integers(2, 80)))
+    arrays['index'] = np.arange(len(arrays['scores']))
+    kept = nms(arrays, iou_threshold, class_agnostic)
+    assert kept['index'].tolist() == greedy_nms(arrays, iou_threshold, class_agnostic)
+
+
+def test_nms_chain():
+    # b is suppressed by a, so c (overlapping only b) is kept
+    arrays = {'image_ids': np.zeros(3, np.int64), 'classes': np.zeros(3, np.int64),
+              'scores': np.array([0.9, 0.8, 0.7]),
+              'boxes': np.array([[0, 0, 9, 9], [3, 0, 12, 9], [7, 0, 16, 9]])}
+    assert nms(arrays, 0.4)['scores'].tolist() == [0.9, 0.7]
+
+
+def test_nms_single_detection():
+    arrays = {'image_ids': np.zeros(1, np.int64), 'classes': np.zeros(1, np.int64),
+              'scores': np.array([0.5]), 'boxes': np.array([[0, 0, 3, 3]])}
+    assert nms(arrays)['scores'].tolist() == [0.5]
@@ -0,0 +1,34 @@
+"""OCRPipeline threads with a stub detector, on pages read from disk."""
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from inference import OCRPipeline
+
+
+class FailingDetector:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, crops):
+        self.calls += 1
+        raise RuntimeError("detector failed")
+
+
+def test_detector_error_stops_threads(tmp_path):
+    page = np.full((60, 200), 255, 'uint8')
+    for x in range(10, 190, 12):
+        page[20:40, x:x + 6] = 0
+    paths = []
+    for i in range(20):
+        paths.append(tmp_path / f'page{i}.png')
+        cv2.imwrite(str(paths[-1]), page)
+    threads = threading.active_count()
+    detector = FailingDetector()
+    # A queue smaller than the crops of the pages, the reader blocks on it when nobody drains it
+    with pytest.raises(RuntimeError, match="detector failed"):
+        OCRPipeline(detector, batch_size=2, queue_size=2).run(paths)
+    assert detector.calls == 1
+    assert threading.active_count() == threads
@@ -0,0 +1,54 @@
+"""Resuming a dataset json cut off by an interrupted run."""
+import json
+
+import pytest
+
+from main import append_json, close_json, write_block
+
+
+def write_blocks(path, blocks):
+    with open(path, 'w') as file:
+        for block in blocks:
+            write_block(file, block)
+        file.write("]")
+
+
+def blocks(start, stop):
+    return [{'id': i, 'text': 'متن', 'parts': ['ﻡ', 'ﺘ', 'ﻦ'], 'n': 3} for i in range(start, stop)]
+
+
+@pytest.mark.parametrize('cut', [0, 1, 5, 20])
+def test_close_truncated_json(tmp_path, cut):
+    path = tmp_path / 'data.json'
+    write_blocks(path, blocks(0, 5))
+    data = path.read_bytes()
+    # Cut inside the last block, the closing bracket is gone too
+    path.write_bytes(data[:-1 - cut])
+    last = close_json(path)
+    expected = 4 if cut == 0 else 3
+    assert last == expected
+    assert [block['id'] for block in json.loads(path.read_text())] == list(range(expected + 1))
+
+
+def test_close_and_append(tmp_path):
+    path = tmp_path / 'data.json'
+    write_blocks(path, blocks(0, 3))
+    path.write_bytes(path.read_bytes()[:-10])
+    last = close_json(path)
+    with append_json(path) as file:
+        for block in blocks(last + 1, last + 4):
+            write_block(file, block)
+        file.write("]")
+    assert [block['id'] for block in json.loads(path.read_text())] == list(range(5))
+
+
+@pytest.mark.parametrize('content', [b'', b'[', b'[{"id": 0, "te'])
+def test_resume_without_blocks(tmp_path, content):
+    path = tmp_path / 'data.json'
+    path.write_bytes(content)
+    assert close_json(path) == -1
+    assert json.loads(path.read_text()) == []
+    with append_json(path) as file:
+        write_block(file, blocks(0, 1)[0])
+        file.write("]")
+    assert [block['id'] for block in json.loads(path.read_text())] == [0]
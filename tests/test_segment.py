@@ -0,0 +1,42 @@
+"""Word segmentation of a synthetic page of rectangles standing in for letters."""
+import numpy as np
+
+from segment import segment_words
+
+
+def draw_page():
+    """A page of three lines, the (inclusive XYXY) box of every word in reading order."""
+    page = np.zeros((120, 300), 'uint8')
+    words = []
+    for top in (10, 50, 90):
+        # Words left to right, letters 1 px apart inside a word and 15 px apart between words
+        x = 20
+        line = []
+        for letters in (2, 3, 1, 4):
+            x0 = x
+            for _ in range(letters):
+                page[top:top + 20, x:x + 8] = 255
+                x += 9
+            line.append([x0, top, x - 2, top + 19])
+            x += 15
+        # Reading order is right to left
+        words.extend(line[::-1])
+    # A dot above the second word of the middle line joins it, its box grows up to the dot
+    page[46:48, 60:63] = 255
+    dotted = words.index([53, 50, 78, 69])
+    words[dotted] = [53, 46, 78, 69]
+    return page, words
+
+
+def test_segment_words():
+    page, words = draw_page()
+    segmentation = segment_words(page)
+    assert segmentation.boxes.tolist() == words
+    assert segmentation.lines.tolist() == [0] * 4 + [1] * 4 + [2] * 4
+    assert segmentation.line_boxes[:, [1, 3]].tolist() == [[10, 29], [46, 69], [90, 109]]
+
+
+def test_segment_empty_page():
+    segmentation = segment_words(np.zeros((50, 80), 'uint8'))
+    assert segmentation.boxes.shape == (0, 4)
+    assert segmentation.lines.shape == (0,)